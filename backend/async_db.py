@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from db import DB_POOL_MAX, DB_POOL_MIN, DB_POOL_TIMEOUT, db_params
+from metrics import add_phase_time, phase
+from slow_query import init_asyncpg_connection
+
+logger = logging.getLogger(__name__)
+
+# Per-connection cache of prepared statements; asyncpg prepares every query once
+# per connection and reuses the plan on later calls.
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))
+# Idle connections are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))
+
+
+def _record_query_time(record):
+    # Runs via call_soon with the request's context, so it adds to that request's "db" phase
+    add_phase_time("db", record.elapsed)
+
+
+async def _init_connection(conn):
+    await init_asyncpg_connection(conn)
+    conn.add_query_logger(_record_query_time)
+
+
+class AsyncConnectionPool:
+    """asyncpg pool used by the FastAPI apps, with the same stats as db.ConnectionPool."""
+
+    def __init__(self, params, minconn=1, maxconn=10, timeout=10.0):
+        self.params = params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self._pool = None
+        self._open_lock = asyncio.Lock()
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def open(self):
+        async with self._open_lock:
+            if self._pool is None:
+                self._pool = await asyncpg.create_pool(
+                    user=self.params['user'],
+                    host=self.params['host'],
+                    database=self.params['database'],
+                    password=self.params['password'],
+                    port=self.params['port'],
+                    min_size=self.minconn,
+                    max_size=self.maxconn,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+                    # Times every statement for the slow-query log and the "db" phase
+                    init=_init_connection,
+                )
+                logger.info(f"Opened asyncpg pool (min={self.minconn}, max={self.maxconn})")
+        return self._pool
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection; asyncpg resets it (rolling back any open transaction) on release.
+
+        Only the checkout counts towards the "db" phase here; statements are
+        added by the query logger, so work done while holding the connection
+        (serialization, sending) is not billed to the database.
+        """
+        with phase("db"):
+            pool = self._pool or await self.open()
+            start = time.monotonic()
+            self._waiting += 1
+            try:
+                conn = await pool.acquire(timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self._timeouts += 1
+                raise
+            finally:
+                self._waiting -= 1
+        waited = time.monotonic() - start
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        try:
+            yield conn
+        finally:
+            with phase("db"):
+                await pool.release(conn)
+
+    async def close(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def stats(self):
+        size = self._pool.get_size() if self._pool else 0
+        idle = self._pool.get_idle_size() if self._pool else 0
+        return {
+            "min_size": self.minconn,
+            "max_size": self.maxconn,
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "waiting": self._waiting,
+            "checkouts": self._checkouts,
+            "timeouts": self._timeouts,
+            "checkout_wait_avg_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+            "checkout_wait_max_ms": round(self._wait_max * 1000, 3),
+        }
+
+
+async_pool = AsyncConnectionPool(db_params, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT)
+
+
+def get_async_connection():
+    """Borrow a pooled asyncpg connection: `async with get_async_connection() as conn: ...`"""
+    return async_pool.connection()
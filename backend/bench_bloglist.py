@@ -0,0 +1,86 @@
+"""Per-request CPU cost of serializing /api/bloglist, old path vs orjson fast path.
+
+    python bench_bloglist.py [--sizes 100,1000,10000] [--repeat 5]
+
+Runs offline on synthetic rows shaped like blog_posts. The old path includes
+the JSONB decode psycopg2 does for every row; the fast path receives
+`content::text` and embeds it as-is.
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from fast_json import FastJSONResponse, json_fragment
+
+
+def synthetic_posts(count):
+    start = datetime(2024, 7, 24, 19, 55, 38, 123456)
+    posts = []
+    for i in range(count):
+        blocks = [
+            {"type": "text", "content": f"<p>Post {i} introduction. " + "Lorem ipsum dolor sit amet. " * 20 + "</p>"},
+            {"type": "image", "content": f"/all_data/4e/5d/{i:064x}.jpg"},
+            {"type": "text", "content": "<p>" + "More body text for the article. " * 40 + "</p>"},
+            {"type": "video", "content": f"/all_data/3a/54/{i + 1:064x}.mp4"},
+        ]
+        posts.append({
+            "id": i + 1,
+            "title": f"Synthetic post number {i}",
+            "slug": f"synthetic-post-number-{i}",
+            "content": json.dumps(blocks),
+            "created_at": start - timedelta(minutes=i),
+        })
+    return posts
+
+
+def old_path(rows):
+    # What get_all_blog_posts did: driver JSONB decode, dict copy, isoformat, jsonable_encoder, json.dumps
+    decoded = [{**row, "content": json.loads(row["content"])} for row in rows]
+    formatted_posts = []
+    for post in decoded:
+        formatted_post = dict(post)
+        if isinstance(formatted_post['created_at'], datetime):
+            formatted_post['created_at'] = formatted_post['created_at'].isoformat()
+        formatted_posts.append(formatted_post)
+    return JSONResponse(content=jsonable_encoder(formatted_posts)).body
+
+
+def fast_path(rows):
+    # Rows as they come back from `content::text`; orjson serializes them in place
+    for row in rows:
+        row["content"] = json_fragment(row["content"])
+    return FastJSONResponse(content=rows).body
+
+
+def time_path(fn, make_rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        rows = make_rows()
+        start = time.process_time()
+        body = fn(rows)
+        timings.append(time.process_time() - start)
+    return statistics.median(timings) * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark blog list serialization")
+    parser.add_argument("--sizes", default="100,1000,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'posts':>7} {'old ms':>9} {'fast ms':>9} {'speedup':>8} {'bytes':>11}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        posts = synthetic_posts(size)
+        make_rows = lambda: [dict(post) for post in posts]
+        old_ms, old_bytes = time_path(old_path, make_rows, args.repeat)
+        fast_ms, fast_bytes = time_path(fast_path, make_rows, args.repeat)
+        print(f"{size:>7} {old_ms:>9.2f} {fast_ms:>9.2f} {old_ms / fast_ms:>7.1f}x {fast_bytes:>11}")
+
+
+if __name__ == "__main__":
+    main()
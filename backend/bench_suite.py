@@ -0,0 +1,204 @@
+"""Offline micro-benchmarks for the auth and blog hot paths.
+
+    python bench_suite.py [--sizes 1000,10000] [--blocks 10] [--repeat 5] [--out results.json]
+                          [--baseline baseline.json] [--save-baseline baseline.json] [--tolerance 0.1]
+
+Benchmarks, all in-process and without a database:
+
+    hash.get_password_hash     server.get_password_hash with the configured ARGON2_* cost
+    hash.verify_password       server.verify_password against that hash
+    jwt.create_access_token    server.create_access_token
+    jwt.decode                 jose jwt.decode of that token
+    list.<view>.<n>            blog_queries.format_list_row + orjson for n synthetic rows
+    create.blocks.<n>          blog_server.attach_media for a post with n image blocks
+
+Results (median and min of --repeat runs, in ms) are written as JSON. With
+--baseline, each benchmark is compared with the saved run and the script
+exits with status 1 if any median is slower by more than --tolerance.
+The apps' INFO logging is switched off so the terminal is not what gets timed.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+
+def measure(fn, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        state = setup() if setup else None
+        start = time.perf_counter()
+        fn(state)
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 4),
+        "min_ms": round(min(timings) * 1000, 4),
+        "repeat": repeat,
+    }
+
+
+def bench_auth(repeat):
+    import server
+    from jose import jwt
+
+    results = {}
+    hashed = server.get_password_hash("correct horse battery staple")
+    results["hash.get_password_hash"] = measure(
+        lambda _: server.get_password_hash("correct horse battery staple"), repeat)
+    results["hash.verify_password"] = measure(
+        lambda _: server.verify_password("correct horse battery staple", hashed), repeat)
+
+    # Token work is far cheaper than hashing, so time batches of 1000
+    token = server.create_access_token({"sub": "bench@example.com"}, timedelta(minutes=30))
+    results["jwt.create_access_token"] = measure(
+        lambda _: [server.create_access_token({"sub": "bench@example.com"}, timedelta(minutes=30))
+                   for _ in range(1000)], repeat)
+    results["jwt.decode"] = measure(
+        lambda _: [jwt.decode(token, server.SECRET_KEY, algorithms=[server.ALGORITHM]) for _ in range(1000)],
+        repeat)
+    for name in ("jwt.create_access_token", "jwt.decode"):
+        results[name]["ops"] = 1000
+    return results
+
+
+def synthetic_rows(count, view):
+    start = datetime(2024, 7, 24, 19, 55, 38, 123456)
+    rows = []
+    for i in range(count):
+        image = {
+            "type": "image", "content": f"/all_data/4e/5d/{i:064x}.jpg", "width": 2400, "height": 1600,
+            "thumbnail": f"/all_data/derived/4e/5d/{i:064x}/thumb.webp",
+            "variants": [{"width": w, "height": w * 2 // 3, "format": fmt,
+                          "url": f"/all_data/derived/4e/5d/{i:064x}/w{w}.{fmt}"}
+                         for w in (640, 1280, 1920) for fmt in ("webp", "jpeg")],
+        }
+        row = {"id": i + 1, "title": f"Synthetic post number {i}", "slug": f"synthetic-post-number-{i}",
+               "created_at": start - timedelta(minutes=i)}
+        if view == "full":
+            row["content"] = json.dumps([
+                {"type": "text", "content": "<p>" + "Lorem ipsum dolor sit amet. " * 40 + "</p>"},
+                image,
+                {"type": "text", "content": "<p>" + "More body text for the article. " * 40 + "</p>"},
+            ])
+            row["version"] = 1
+        else:
+            row["excerpt"] = ("Lorem ipsum dolor sit amet. " * 20)[:300]
+            # asyncpg hands jsonb over as text
+            row["image_block"] = json.dumps(image)
+        rows.append(row)
+    return rows
+
+
+def bench_list(sizes, repeat):
+    import orjson
+    from blog_queries import format_list_row
+
+    results = {}
+    for view in ("full", "summary"):
+        for size in sizes:
+            rows = synthetic_rows(size, view)
+            results[f"list.{view}.{size}"] = measure(
+                lambda batch: orjson.dumps([format_list_row(row) for row in batch]),
+                repeat, setup=lambda: [dict(row) for row in rows])
+    return results
+
+
+def bench_create(blocks, repeat):
+    from starlette.datastructures import UploadFile
+    from blog_server import attach_media
+
+    image = os.urandom(256 * 1024)
+
+    def setup():
+        post = [{"type": "image", "content": ""} if i % 2 else {"type": "text", "content": "<p>text</p>"}
+                for i in range(blocks * 2)]
+        # Distinct content per file and run so nothing is deduplicated
+        files = [UploadFile(io.BytesIO(os.urandom(16) + image), filename=f"image{i}.jpg") for i in range(blocks)]
+        return post, files
+
+    return {f"create.blocks.{blocks}": measure(
+        lambda state: asyncio.run(attach_media(*state)), repeat, setup=setup)}
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table; returns the names of benchmarks slower than baseline by > tolerance."""
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>12} {result['median_ms']:>12.3f} {'new':>8}")
+            continue
+        change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+        flag = " !" if change > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<28} {before['median_ms']:>12.3f} {result['median_ms']:>12.3f} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the auth and blog micro-benchmarks")
+    parser.add_argument("--sizes", default="1000,10000", help="Row counts for the list benchmarks")
+    parser.add_argument("--blocks", type=int, default=10, help="Image blocks per post for the create benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default="auth,list,create", help="Comma-separated groups to run")
+    parser.add_argument("--out", default="bench_results.json", help="Where to write this run's results")
+    parser.add_argument("--baseline", help="Saved results to compare against")
+    parser.add_argument("--save-baseline", help="Also write this run's results here")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before failing")
+    args = parser.parse_args()
+
+    # Uploads from the create benchmark go to a throwaway directory
+    upload_dir = tempfile.mkdtemp(prefix="bench_suite_")
+    os.environ["UPLOAD_DIR"] = upload_dir
+    logging.disable(logging.INFO)
+    groups = set(args.only.split(","))
+
+    results = {}
+    try:
+        if "auth" in groups:
+            results.update(bench_auth(args.repeat))
+        if "list" in groups:
+            results.update(bench_list([int(s) for s in args.sizes.split(",")], args.repeat))
+        if "create" in groups:
+            results.update(bench_create(args.blocks, args.repeat))
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {"sizes": args.sizes, "blocks": args.blocks, "repeat": args.repeat},
+        },
+        "results": results,
+    }
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        if regressions:
+            print(f"Slower than baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            print(f"{name:<28} {result['median_ms']:>12.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import json
+
+from fast_json import json_fragment
+from media_derivatives import build_srcset
+
+# SQL fragments and row formatting shared by blog_server.py and export_static.py.
+# Kept out of blog_server so scripts can use them without building the app.
+
+# Columns of a single post; content comes back as JSON text and is passed through untouched
+BLOG_POST_COLUMNS = "id, title, slug, content::text AS content, created_at, version"
+
+EXCERPT_LENGTH = 300
+
+# Columns returned for each view of /api/bloglist
+BLOGLIST_COLUMNS = {
+    "full": BLOG_POST_COLUMNS,
+    # Tag-stripped excerpt of the first text block and the first image block (with derivatives)
+    "summary": f"""
+        id, title, slug, created_at,
+        left(regexp_replace(
+            jsonb_path_query_first(content, '$[*] ? (@.type == "text").content') #>> '{{}}',
+            '<[^>]*>', '', 'g'), {EXCERPT_LENGTH}) AS excerpt,
+        jsonb_path_query_first(content, '$[*] ? (@.type == "image")') AS image_block
+    """,
+}
+
+
+def format_list_row(post):
+    """Prepare a BLOGLIST_COLUMNS row (as a dict) for orjson, in place."""
+    if 'content' in post:
+        post['content'] = json_fragment(post['content'])
+    if 'image_block' in post:
+        image_block = post.pop('image_block') or 'null'
+        image_block = (json.loads(image_block) if isinstance(image_block, str) else image_block) or {}
+        post['image_path'] = image_block.get('content')
+        post['thumbnail'] = image_block.get('thumbnail')
+        post['width'] = image_block.get('width')
+        post['height'] = image_block.get('height')
+        post['srcset'] = build_srcset(image_block)
+    return post
@@ -0,0 +1,66 @@
+import os
+
+# Text search configuration used for both indexing and querying
+BLOG_SEARCH_CONFIG = os.getenv("BLOG_SEARCH_CONFIG", "english")
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+# Idempotent DDL run once per deployment by migrate_search.py, not at app startup:
+# replacing the trigger locks blog_posts, and workers starting together would
+# race on CREATE OR REPLACE FUNCTION. search_vector is kept up to date by the
+# trigger, so queries never rebuild it.
+SCHEMA = [
+    "ALTER TABLE blog_posts ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    # Plain text of the text-type blocks, HTML tags removed
+    """
+    CREATE OR REPLACE FUNCTION blog_posts_search_text(content jsonb) RETURNS text
+    LANGUAGE sql IMMUTABLE AS $$
+        SELECT coalesce(string_agg(regexp_replace(elem->>'content', '<[^>]*>', ' ', 'g'), ' '), '')
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(content) = 'array' THEN content ELSE '[]'::jsonb END
+        ) AS elem
+        WHERE elem->>'type' = 'text'
+    $$
+    """,
+    f"""
+    CREATE OR REPLACE FUNCTION blog_posts_search_vector_update() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{BLOG_SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('{BLOG_SEARCH_CONFIG}', blog_posts_search_text(NEW.content)), 'B');
+        RETURN NEW;
+    END
+    $$
+    """,
+    "DROP TRIGGER IF EXISTS blog_posts_search_vector_trigger ON blog_posts",
+    """
+    CREATE TRIGGER blog_posts_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON blog_posts
+    FOR EACH ROW EXECUTE FUNCTION blog_posts_search_vector_update()
+    """,
+    # Backfill rows written before the trigger existed (fires the trigger)
+    "UPDATE blog_posts SET title = title WHERE search_vector IS NULL",
+    "CREATE INDEX IF NOT EXISTS blog_posts_search_idx ON blog_posts USING GIN (search_vector)",
+]
+
+# Rank on the GIN-matched rows first; ts_headline only runs for the returned page
+SEARCH_QUERY = f"""
+    SELECT p.id, p.title, p.slug, p.created_at, hits.rank,
+           ts_headline('{BLOG_SEARCH_CONFIG}', blog_posts_search_text(p.content), hits.query,
+                       '{HEADLINE_OPTIONS}') AS snippet
+    FROM (
+        SELECT id, query, ts_rank_cd(search_vector, query) AS rank
+        FROM blog_posts, websearch_to_tsquery('{BLOG_SEARCH_CONFIG}', $1) AS query
+        WHERE search_vector @@ query
+        ORDER BY rank DESC, created_at DESC, id DESC
+        LIMIT $2 OFFSET $3
+    ) AS hits
+    JOIN blog_posts p ON p.id = hits.id
+    ORDER BY hits.rank DESC, p.created_at DESC, p.id DESC
+"""
+
+
+async def search_posts(conn, q: str, limit: int, offset: int):
+    """Ranked matches for `q` with highlighted snippets; fetches one extra row to detect a next page."""
+    rows = await conn.fetch(SEARCH_QUERY, q, limit + 1, offset)
+    return [dict(row) for row in rows]
@@ -1,18 +1,31 @@
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, HTTPException, File, UploadFile, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
 from datetime import datetime
 import logging
-import shutil
 from urllib.parse import unquote
 import json
+import base64
+import orjson
+from async_db import get_async_connection, async_pool
+from http_cache import ResponseCache
+import metrics
+import profiling
+from slow_query import slow_query_log
+from metrics import phase
+from fast_json import FastJSONResponse, json_fragment
+from slugs import unique_slug_async
+import blog_search
+import media_store
+from media_store import UPLOAD_DIR
+from media_ingest import INGEST_WORKERS, MAX_FILE_BYTES, MediaIngest, RequestSizeLimit, UploadTooLarge
+from upload_sessions import DEFAULT_CHUNK_SIZE, UploadError, UploadSessions
+from media_derivatives import MEDIA_WORKERS, DerivativePipeline
+from blog_queries import BLOG_POST_COLUMNS, BLOGLIST_COLUMNS, format_list_row
+from media_server import serve_media
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,6 +33,9 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+# Oversized media uploads are refused before Starlette spools them to disk
+app.add_middleware(RequestSizeLimit)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -27,55 +43,80 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges", "Upload-Offset"],
 )
 
-# Correct db_params:
-db_params = {
-    'user': os.getenv("DB_USER", "postgres"),  # Changed to "postgres"
-    'host': os.getenv("DB_HOST", "localhost"),
-    'database': os.getenv("DB_NAME", "dahwin"),
-    'password': os.getenv("DB_PASSWORD", "5779ra"),
-    'port': int(os.getenv("DB_PORT", 5432)),
-}
-
-def get_db_connection():
-    try:
-        conn = psycopg2.connect(**db_params)
-        return conn
-    except psycopg2.Error as e:
-        logger.error(f"Unable to connect to the database: {e}")
-        raise
-
 # Create tables if they don't exist
-def create_tables():
-    conn = get_db_connection()
-    cur = conn.cursor()
+@app.on_event("startup")
+async def create_tables():
     try:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS blog_posts (
-                id SERIAL PRIMARY KEY,
-                title VARCHAR(255) NOT NULL,
-                content JSONB NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
+        async with get_async_connection() as conn:
+            async with conn.transaction():
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS blog_posts (
+                        id SERIAL PRIMARY KEY,
+                        title VARCHAR(255) NOT NULL,
+                        content JSONB NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                # URL slug; existing rows are backfilled by migrate_slugs.py
+                await conn.execute("ALTER TABLE blog_posts ADD COLUMN IF NOT EXISTS slug VARCHAR(255)")
+                await conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS blog_posts_slug_key ON blog_posts (slug)")
+                # Bumped on every PATCH for optimistic concurrency
+                await conn.execute("ALTER TABLE blog_posts ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+                # Reference counts of content-addressed media files, keyed by path under UPLOAD_DIR
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS media_blobs (
+                        path VARCHAR(255) PRIMARY KEY,
+                        digest CHAR(64) NOT NULL,
+                        size BIGINT NOT NULL,
+                        refcount INTEGER NOT NULL DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                # Last refcount change; media GC only trusts counts that moved recently
+                await conn.execute(
+                    "ALTER TABLE media_blobs ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"
+                )
+                # Full-text search column, trigger and GIN index are created by migrate_search.py
+                # Keyset pagination index for /api/bloglist
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS blog_posts_created_at_id_idx
+                    ON blog_posts (created_at DESC, id DESC)
+                """)
         logger.info("Tables created successfully")
     except Exception as e:
         logger.error(f"Error creating tables: {str(e)}")
-        conn.rollback()
-    finally:
-        cur.close()
-        conn.close()
-
-create_tables()
 
 # Ensure the upload directory exists
-UPLOAD_DIR = "all_data"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Mount the static files directory
-app.mount("/all_data", StaticFiles(directory=UPLOAD_DIR), name="all_data")
+# Serve uploaded media with Range support, long-lived cache headers and
+# optional X-Accel-Redirect hand-off (see media_server.py)
+@app.api_route("/all_data/{path:path}", methods=["GET", "HEAD"])
+def get_media(request: Request, path: str):
+    return serve_media(request, path)
+
+# Serialized responses of the read endpoints, dropped whenever a post changes.
+# The TTL bounds staleness for changes made by other workers or scripts.
+BLOG_CACHE_SIZE = int(os.getenv("BLOG_CACHE_SIZE", 512))
+BLOG_CACHE_TTL = float(os.getenv("BLOG_CACHE_TTL", 300))
+BLOG_HTTP_MAX_AGE = int(os.getenv("BLOG_HTTP_MAX_AGE", 30))
+response_cache = ResponseCache(
+    maxsize=BLOG_CACHE_SIZE,
+    ttl=BLOG_CACHE_TTL,
+    cache_control=f"public, max-age={BLOG_HTTP_MAX_AGE}",
+)
+
+# Thumbnails, responsive widths and WebP variants are produced after the response is sent
+derivative_pipeline = DerivativePipeline(MEDIA_WORKERS, on_update=response_cache.invalidate)
+
+# Concurrent, size-limited streaming of uploaded files into the blob store
+media_ingest = MediaIngest(INGEST_WORKERS)
+
+# Resumable uploads for large files, referenced from blocks by upload_id
+upload_sessions = UploadSessions(max_file_bytes=MAX_FILE_BYTES)
 
 class ContentBlock(BaseModel):
     type: str
@@ -85,122 +126,512 @@ class BlogPostCreate(BaseModel):
     title: str
     blocks: List[ContentBlock]
 
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    chunk_size: Optional[int] = None
+
+async def attach_media(blocks, files, keep_existing=False):
+    """Give each image/video block a blob URL from `upload_id` or the next file in `files`.
+
+    With keep_existing, blocks that already point at a stored file (content-addressed
+    or legacy) are left alone, and only blocks without content take a file.
+    Returns the StoredBlobs to reference and the upload sessions to remove once saved.
+    """
+    uploads = []
+    media_blocks = []
+    upload_ids = []
+    resumed_blobs = []
+    file_index = 0
+    for block in blocks:
+        logger.info(f"Processing block: {block['type']}")
+        if block['type'] in ['image', 'video']:
+            if block.get('upload_id'):
+                # Finalized resumable upload: the file is already in the blob store
+                upload_id = block.pop('upload_id')
+                blob = await upload_sessions.resolve(upload_id)
+                block['content'] = blob.url
+                resumed_blobs.append(blob)
+                upload_ids.append(upload_id)
+            elif keep_existing and block.get('content'):
+                if media_store.is_stored_url(block['content']):
+                    continue
+                logger.warning(f"Dropping missing media {block['content']} from {block['type']} block")
+                block['content'] = ""
+            elif files and file_index < len(files):
+                uploads.append(files[file_index])
+                media_blocks.append(block)
+                file_index += 1
+            else:
+                logger.warning(f"No file provided for {block['type']} block")
+                block['content'] = ""
+
+    # Store all attached files concurrently, once each under its content hash
+    stored_blobs = await media_ingest.ingest(uploads)
+    for block, blob in zip(media_blocks, stored_blobs):
+        block['content'] = blob.url
+    return stored_blobs + resumed_blobs, upload_ids
+
 @app.post("/api/blog")
 async def create_blog_post(
     title: str = Form(...),
     blocks: str = Form(...),
     files: List[UploadFile] = File(None)
 ):
-    conn = get_db_connection()
-    cur = conn.cursor()
     try:
-        blocks_data = json.loads(blocks)
-        processed_blocks = []
-        file_index = 0
+        processed_blocks = json.loads(blocks)
 
         logger.info(f"Received blog post creation request. Title: {title}")
-        logger.info(f"Number of blocks: {len(blocks_data)}")
+        logger.info(f"Number of blocks: {len(processed_blocks)}")
         logger.info(f"Number of files received: {len(files) if files else 0}")
 
-        for block in blocks_data:
-            logger.info(f"Processing block: {block['type']}")
-            if block['type'] in ['image', 'video']:
-                if files and file_index < len(files):
-                    file = files[file_index]
-                    file_index += 1
-                    filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{file.filename}"
-                    file_path = os.path.join(UPLOAD_DIR, filename)
-                    
-                    # Ensure the UPLOAD_DIR exists
-                    os.makedirs(UPLOAD_DIR, exist_ok=True)
-                    
-                    # Save the file
-                    with open(file_path, "wb") as buffer:
-                        shutil.copyfileobj(file.file, buffer)
-                    
-                    # Update the block content with the correct path
-                    block['content'] = f"/all_data/{filename}"
-                    
-                    logger.info(f"File saved: {file_path}")
-                else:
-                    logger.warning(f"No file provided for {block['type']} block")
-                    block['content'] = ""
-            processed_blocks.append(block)
-
-        cur.execute("""
-            INSERT INTO blog_posts (title, content)
-            VALUES (%s, %s)
-            RETURNING id
-        """, (title, json.dumps(processed_blocks)))
-        
-        new_id = cur.fetchone()[0]
-        conn.commit()
-        
+        stored_blobs, upload_ids = await attach_media(processed_blocks, files)
+
+        async with get_async_connection() as conn:
+            async with conn.transaction():
+                slug = await unique_slug_async(conn, title)
+                new_id = await conn.fetchval("""
+                    INSERT INTO blog_posts (title, slug, content)
+                    VALUES ($1, $2, $3::jsonb)
+                    RETURNING id
+                """, title, slug, json.dumps(processed_blocks))
+                await media_store.add_references(conn, stored_blobs)
+        response_cache.invalidate()
+        derivative_pipeline.schedule(processed_blocks)
+        for upload_id in upload_ids:
+            await upload_sessions.remove(upload_id)
+
         logger.info(f"Blog post created successfully with id: {new_id}")
-        return JSONResponse(status_code=201, content={"message": "Blog post created successfully", "id": new_id})
+        return JSONResponse(status_code=201, content={"message": "Blog post created successfully", "id": new_id, "slug": slug})
+    except UploadTooLarge as e:
+        logger.warning(f"Rejected blog post upload: {str(e)}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        conn.rollback()
         logger.error(f"Error creating blog post: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+
+@app.post("/api/uploads")
+async def create_upload(upload: UploadCreate):
+    status = await upload_sessions.create(upload.filename, upload.size, upload.chunk_size or DEFAULT_CHUNK_SIZE)
+    return JSONResponse(status_code=201, content=status)
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    status = await upload_sessions.status(upload_id)
+    return JSONResponse(content=status, headers={"Upload-Offset": str(status["offset"])})
+
+@app.put("/api/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(request: Request, upload_id: str, index: int):
+    status = await upload_sessions.write_chunk(upload_id, index, request.stream())
+    return JSONResponse(content=status, headers={"Upload-Offset": str(status["offset"])})
+
+@app.post("/api/uploads/{upload_id}/finalize")
+async def finalize_upload(upload_id: str):
+    return await upload_sessions.finalize(upload_id)
+
+@app.delete("/api/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    await upload_sessions.remove(upload_id)
+    return {"message": "Upload deleted successfully", "upload_id": upload_id}
+
+def decode_content(content):
+    # JSONB arrives as text from asyncpg; older rows may hold a JSON string or plain text
+    if isinstance(content, str):
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError:
+            # If content is not valid JSON, wrap it in a list with a single text block
+            return [{'type': 'text', 'content': content}]
+    return content
+
+def encode_cursor(created_at: datetime, post_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{post_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, post_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+BLOGLIST_MAX_LIMIT = 100
+BLOGLIST_STREAM_BATCH = int(os.getenv("BLOGLIST_STREAM_BATCH", 200))
 
 @app.get("/api/bloglist")
-def get_all_blog_posts():
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+async def get_all_blog_posts(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=BLOGLIST_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    view: str = "full",
+    stream: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+):
+    """List posts newest first.
+
+    Without `limit` or `cursor` every post is returned, as before. With them the
+    list is paged on (created_at, id) and the next page's cursor is sent in the
+    X-Next-Cursor header. `view=summary` drops the full block content.
+    `stream=json` or `stream=ndjson` sends every post as it is read instead of
+    building the whole response in memory.
+    """
+    if stream is not None:
+        if limit is not None or cursor is not None:
+            raise HTTPException(status_code=400, detail="stream cannot be combined with limit or cursor")
+        if view not in BLOGLIST_COLUMNS:
+            raise HTTPException(status_code=400, detail=f"view must be one of {sorted(BLOGLIST_COLUMNS)}")
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return StreamingResponse(stream_blog_list(view, stream), media_type=media_type)
+    return await response_cache.respond(request, lambda: build_blog_list(limit, cursor, view))
+
+async def stream_blog_list(view: str, fmt: str):
+    """Yield the blog list as a JSON array or NDJSON, BLOGLIST_STREAM_BATCH rows at a time.
+
+    Rows come from a server-side cursor, so memory use depends on the batch
+    size and not on the number of posts.
+    """
+    query = f"SELECT {BLOGLIST_COLUMNS[view]} FROM blog_posts ORDER BY created_at DESC, id DESC"
+    separator = b"\n" if fmt == "ndjson" else b","
+    count = 0
+    if fmt == "json":
+        yield b"["
+    try:
+        async with get_async_connection() as conn:
+            # asyncpg cursors only exist inside a transaction
+            async with conn.transaction():
+                # Cursor fetches bypass the query logger, so they are timed here
+                with phase("db"):
+                    cur = await conn.cursor(query)
+                while True:
+                    with phase("db"):
+                        rows = await cur.fetch(BLOGLIST_STREAM_BATCH)
+                    if not rows:
+                        break
+                    with phase("json"):
+                        chunk = separator.join(orjson.dumps(format_list_row(dict(row))) for row in rows)
+                    if fmt == "ndjson":
+                        yield chunk + b"\n"
+                    else:
+                        yield (b"," if count else b"") + chunk
+                    count += len(rows)
+    except Exception as e:
+        # The status line is already sent; the client sees a truncated body
+        logger.error(f"Error streaming blog posts after {count} rows: {str(e)}")
+        raise
+    if fmt == "json":
+        yield b"]"
+    logger.info(f"Streamed {count} blog posts")
+
+async def build_blog_list(limit: Optional[int], cursor: Optional[str], view: str):
+    if view not in BLOGLIST_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"view must be one of {sorted(BLOGLIST_COLUMNS)}")
+    paginated = limit is not None or cursor is not None
+    page_size = limit or BLOGLIST_MAX_LIMIT
+
+    query = f"SELECT {BLOGLIST_COLUMNS[view]} FROM blog_posts"
+    params = []
+    if cursor is not None:
+        query += " WHERE (created_at, id) < ($1, $2)"
+        params.extend(decode_cursor(cursor))
+    query += " ORDER BY created_at DESC, id DESC"
+    if paginated:
+        # One extra row tells us whether there is a next page
+        params.append(page_size + 1)
+        query += f" LIMIT ${len(params)}"
+
     try:
-        cur.execute("SELECT * FROM blog_posts ORDER BY created_at DESC")
-        blog_posts = cur.fetchall()
-        
-        formatted_posts = []
-        for post in blog_posts:
-            formatted_post = dict(post)
-            if isinstance(formatted_post['created_at'], datetime):
-                formatted_post['created_at'] = formatted_post['created_at'].isoformat()
-            
-            # Handle content field
-            try:
-                formatted_post['content'] = json.loads(formatted_post['content'])
-            except json.JSONDecodeError:
-                # If content is not valid JSON, wrap it in a list with a single text block
-                formatted_post['content'] = [{'type': 'text', 'content': formatted_post['content']}]
-            
-            formatted_posts.append(formatted_post)
-        
-        logger.info(f"Retrieved {len(formatted_posts)} blog posts")
-        
-        return JSONResponse(content=jsonable_encoder(formatted_posts))
+        async with get_async_connection() as conn:
+            blog_posts = [dict(row) for row in await conn.fetch(query, *params)]
     except Exception as e:
         logger.error(f"Error fetching blog posts: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+
+    headers = {}
+    if paginated and len(blog_posts) > page_size:
+        blog_posts = blog_posts[:page_size]
+        last = blog_posts[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last['created_at'], last['id'])
+
+    # Rows are serialized in place by orjson: no isoformat or jsonable_encoder pass
+    for post in blog_posts:
+        format_list_row(post)
+
+    logger.info(f"Retrieved {len(blog_posts)} blog posts")
+
+    return FastJSONResponse(content=blog_posts, headers=headers)
 
 @app.get("/api/blog/title/{title}")
-def get_blog_post_by_title(title: str):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
+async def get_blog_post_by_title(request: Request, title: str):
+    return await response_cache.respond(request, lambda: build_blog_post_by_title(title))
+
+async def build_blog_post_by_title(title: str):
     try:
         decoded_title = unquote(title).replace('-', ' ')
-        cur.execute("SELECT * FROM blog_posts WHERE title ILIKE %s", (decoded_title,))
-        blog_post = cur.fetchone()
-        if blog_post is None:
-            raise HTTPException(status_code=404, detail="Blog post not found")
-        
-        if isinstance(blog_post['created_at'], datetime):
-            blog_post['created_at'] = blog_post['created_at'].isoformat()
-        blog_post['content'] = json.loads(blog_post['content'])
-        
-        return JSONResponse(content=jsonable_encoder(blog_post))
+        async with get_async_connection() as conn:
+            blog_post = await conn.fetchrow(
+                f"SELECT {BLOG_POST_COLUMNS} FROM blog_posts WHERE title ILIKE $1", decoded_title
+            )
+    except Exception as e:
+        logger.error(f"Error fetching blog post: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    if blog_post is None:
+        raise HTTPException(status_code=404, detail="Blog post not found")
+
+    blog_post = dict(blog_post)
+    blog_post['content'] = json_fragment(blog_post['content'])
+
+    return FastJSONResponse(content=blog_post)
+
+@app.get("/api/blog/slug/{slug}")
+async def get_blog_post_by_slug(request: Request, slug: str):
+    return await response_cache.respond(request, lambda: build_blog_post_by_slug(slug))
+
+async def build_blog_post_by_slug(slug: str):
+    try:
+        async with get_async_connection() as conn:
+            # Point lookup on the unique blog_posts_slug_key index
+            blog_post = await conn.fetchrow(f"SELECT {BLOG_POST_COLUMNS} FROM blog_posts WHERE slug = $1", slug)
     except Exception as e:
         logger.error(f"Error fetching blog post: {str(e)}")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
+    if blog_post is None:
+        raise HTTPException(status_code=404, detail="Blog post not found")
+
+    blog_post = dict(blog_post)
+    blog_post['content'] = json_fragment(blog_post['content'])
+
+    return FastJSONResponse(content=blog_post)
+
+SEARCH_MAX_LIMIT = 50
+
+@app.get("/api/blog/search")
+async def search_blog_posts(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=SEARCH_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+):
+    return await response_cache.respond(request, lambda: build_search_results(q, limit, offset))
+
+async def build_search_results(q: str, limit: int, offset: int):
+    try:
+        async with get_async_connection() as conn:
+            results = await blog_search.search_posts(conn, q, limit, offset)
+    except Exception as e:
+        logger.error(f"Error searching blog posts: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+    next_offset = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_offset = offset + limit
+
+    logger.info(f"Search {q!r} returned {len(results)} blog posts")
+
+    return FastJSONResponse(content={
+        "query": q,
+        "results": results,
+        "offset": offset,
+        "next_offset": next_offset,
+    })
+
+def _op_index(op, key, bound):
+    index = op[key]
+    if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < bound:
+        raise ValueError(f"{key} must be an integer from 0 to {bound - 1}")
+    return index
+
+def _op_block(op):
+    block = op['block']
+    if not isinstance(block, dict) or not isinstance(block.get('type'), str):
+        raise ValueError("block must be an object with a type")
+    return block
+
+def plan_block_ops(length, ops):
+    """Apply `ops` to the layout of a post with `length` blocks, without their content.
+
+    Returns the new layout: ints are indexes of stored blocks that are kept,
+    dicts are blocks inserted or replaced by this request.
+    """
+    slots = list(range(length))
+    for op in ops:
+        kind = op.get('op') if isinstance(op, dict) else None
+        try:
+            if kind == 'insert':
+                slots.insert(_op_index(op, 'index', len(slots) + 1), _op_block(op))
+            elif kind == 'replace':
+                slots[_op_index(op, 'index', len(slots))] = _op_block(op)
+            elif kind == 'delete':
+                del slots[_op_index(op, 'index', len(slots))]
+            elif kind == 'move':
+                slot = slots.pop(_op_index(op, 'from', len(slots)))
+                slots.insert(_op_index(op, 'to', len(slots) + 1), slot)
+            else:
+                raise ValueError(f"unknown op {kind!r}")
+        except (KeyError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid block operation {op}: {e}")
+    return slots
+
+# The new content is assembled inside Postgres from kept blocks (by index) and new blocks
+PATCH_CONTENT_QUERY = """
+    UPDATE blog_posts SET
+        content = (
+            SELECT coalesce(jsonb_agg(
+                CASE WHEN s.src IS NULL THEN s.block ELSE blog_posts.content -> s.src END
+                ORDER BY s.ord), '[]'::jsonb)
+            FROM unnest($2::int[], $3::jsonb[]) WITH ORDINALITY AS s(src, block, ord)
+        ),
+        version = version + 1
+    WHERE id = $1
+    RETURNING version
+"""
+
+@app.patch("/api/blog/{post_id}")
+async def update_blog_post(
+    post_id: int,
+    version: int = Form(...),
+    ops: str = Form(...),
+    files: List[UploadFile] = File(None)
+):
+    """Insert, replace, move or delete individual blocks of a post.
+
+    `ops` is a JSON list applied in order: {"op": "insert" | "replace", "index", "block"},
+    {"op": "delete", "index"} and {"op": "move", "from", "to"}. New image/video
+    blocks take the next file, an `upload_id`, or keep an existing blob URL.
+    `version` must match the stored version, otherwise nothing changes and 409 is returned.
+    """
+    try:
+        ops_data = json.loads(ops)
+    except json.JSONDecodeError:
+        ops_data = None
+    if not isinstance(ops_data, list):
+        raise HTTPException(status_code=400, detail="ops must be a JSON list")
+
+    async with get_async_connection() as conn:
+        current = await conn.fetchrow("""
+            SELECT version, jsonb_typeof(content) = 'array' AS is_list,
+                   CASE WHEN jsonb_typeof(content) = 'array' THEN jsonb_array_length(content) ELSE 0 END AS length
+            FROM blog_posts WHERE id = $1
+        """, post_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail="Blog post not found")
+    if current['version'] != version:
+        raise HTTPException(status_code=409, detail=f"Blog post has changed; current version is {current['version']}")
+    if not current['is_list']:
+        raise HTTPException(status_code=400, detail="Blog post content is not a list of blocks")
+
+    slots = plan_block_ops(current['length'], ops_data)
+    try:
+        # Media is stored before the transaction so uploads never hold a row lock
+        op_blocks = [op['block'] for op in ops_data if op['op'] in ('insert', 'replace')]
+        stored_blobs, upload_ids = await attach_media(op_blocks, files, keep_existing=True)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    new_blocks = [slot for slot in slots if isinstance(slot, dict)]
+    removed = sorted(set(range(current['length'])) - {slot for slot in slots if isinstance(slot, int)})
+    try:
+        async with get_async_connection() as conn:
+            async with conn.transaction():
+                locked = await conn.fetchval("SELECT version FROM blog_posts WHERE id = $1 FOR UPDATE", post_id)
+                if locked != version:
+                    raise HTTPException(status_code=409, detail=f"Blog post has changed; current version is {locked}")
+                removed_blocks = await conn.fetchval(
+                    "SELECT jsonb_agg(content -> i)::text FROM blog_posts, unnest($2::int[]) AS i WHERE id = $1",
+                    post_id, removed,
+                )
+                new_version = await conn.fetchval(
+                    PATCH_CONTENT_QUERY, post_id,
+                    [slot if isinstance(slot, int) else None for slot in slots],
+                    [json.dumps(slot) if isinstance(slot, dict) else None for slot in slots],
+                )
+                # Count references for the media of new blocks, then release those of removed ones
+                blobs_by_path = {blob.path: blob for blob in stored_blobs}
+                added = media_store.media_paths(new_blocks)
+                await media_store.add_references(conn, [blobs_by_path[p] for p in added if p in blobs_by_path])
+                await media_store.add_path_references(conn, [p for p in added if p not in blobs_by_path])
+                await media_store.release_references(conn, media_store.media_paths(decode_content(removed_blocks or '[]')))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating blog post: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+    response_cache.invalidate()
+    derivative_pipeline.schedule(new_blocks)
+    for upload_id in upload_ids:
+        await upload_sessions.remove(upload_id)
+
+    logger.info(f"Blog post {post_id} updated to version {new_version} ({len(ops_data)} operations)")
+    return {"message": "Blog post updated successfully", "id": post_id, "version": new_version}
+
+@app.delete("/api/blog/{post_id}")
+async def delete_blog_post(post_id: int):
+    try:
+        async with get_async_connection() as conn:
+            async with conn.transaction():
+                deleted = await conn.fetchval("DELETE FROM blog_posts WHERE id = $1 RETURNING content", post_id)
+                if deleted is not None:
+                    await media_store.release_references(conn, media_store.media_paths(decode_content(deleted)))
+    except Exception as e:
+        logger.error(f"Error deleting blog post: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    if deleted is None:
+        raise HTTPException(status_code=404, detail="Blog post not found")
+    response_cache.invalidate()
+    logger.info(f"Blog post deleted: {post_id}")
+    return {"message": "Blog post deleted successfully", "id": post_id}
+
+@app.get("/api/blog/cache")
+def blog_cache_stats():
+    return response_cache.stats()
+
+@app.get("/api/blog/media/ingest")
+def media_ingest_stats():
+    return media_ingest.stats()
+
+@app.get("/api/blog/db/pool")
+def db_pool_stats():
+    return async_pool.stats()
+
+# Request latency, per-phase timing and pool/cache/ingest gauges on GET /metrics
+metrics.install(app, "blog", collectors={
+    "blog_db_pool": async_pool.stats,
+    "blog_response_cache": response_cache.stats,
+    "blog_media_ingest": media_ingest.stats,
+    "blog_slow_queries": slow_query_log.stats,
+})
+# Per-request profiles on demand (X-Profile header or PROFILE_SAMPLE_RATE)
+profiling.install(app, "blog")
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await async_pool.close()
+
+@app.on_event("shutdown")
+def shutdown_derivative_pipeline():
+    derivative_pipeline.shutdown()
+
+@app.on_event("shutdown")
+def shutdown_media_ingest():
+    media_ingest.shutdown()
+
+@app.on_event("startup")
+def purge_expired_uploads():
+    removed = upload_sessions.purge_expired()
+    if removed:
+        logger.info(f"Removed {removed} expired upload sessions")
+
+@app.exception_handler(UploadError)
+async def upload_error_handler(request, exc):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"message": str(exc)}
+    )
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -0,0 +1,84 @@
+"""Pick argon2 cost parameters that hit a per-hash latency budget on this host.
+
+    python calibrate_hash.py --target-ms 250 [--env-file .env]
+
+Prints ARGON2_* settings for hashing.py and optionally writes them into an env file.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from passlib.hash import argon2
+
+# Memory costs tried, in KiB (19 MiB is the OWASP minimum for argon2id)
+MEMORY_STEPS = [19456, 32768, 65536, 131072, 262144, 524288]
+MIN_TIME_COST = 2
+
+
+def measure(time_cost, memory_cost, parallelism, samples):
+    """Median wall time in ms of one hash with the given parameters."""
+    handler = argon2.using(rounds=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        handler.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms, parallelism, max_memory, samples):
+    best = None
+    for memory_cost in MEMORY_STEPS:
+        if memory_cost > max_memory:
+            break
+        one_pass = measure(1, memory_cost, parallelism, samples)
+        time_cost = int(target_ms // one_pass) if one_pass > 0 else MIN_TIME_COST
+        print(f"memory={memory_cost // 1024} MiB: {one_pass:.1f} ms/pass -> time_cost={time_cost}")
+        if time_cost < MIN_TIME_COST:
+            # More memory would force us below the minimum number of passes
+            break
+        best = (time_cost, memory_cost)
+    if best is None:
+        # Even the smallest memory step is over budget; keep the minimum safe parameters
+        best = (MIN_TIME_COST, MEMORY_STEPS[0])
+    time_cost, memory_cost = best
+    measured = measure(time_cost, memory_cost, parallelism, samples)
+    return {
+        "ARGON2_TIME_COST": time_cost,
+        "ARGON2_MEMORY_COST": memory_cost,
+        "ARGON2_PARALLELISM": parallelism,
+    }, measured
+
+
+def write_env_file(path, settings):
+    """Replace or append the ARGON2_* keys in a dotenv file, keeping everything else."""
+    lines = []
+    if os.path.exists(path):
+        with open(path) as f:
+            lines = [line for line in f.read().splitlines() if line.split("=", 1)[0].strip() not in settings]
+    lines.extend(f"{key}={value}" for key, value in settings.items())
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate argon2 cost parameters for this host")
+    parser.add_argument("--target-ms", type=float, default=250, help="latency budget per hash")
+    parser.add_argument("--parallelism", type=int, default=min(os.cpu_count() or 1, 4))
+    parser.add_argument("--max-memory-mib", type=int, default=256)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--env-file", help="dotenv file to update with the chosen settings")
+    args = parser.parse_args()
+
+    settings, measured = calibrate(args.target_ms, args.parallelism, args.max_memory_mib * 1024, args.samples)
+    print(f"\nChosen parameters hash in {measured:.1f} ms (target {args.target_ms:.0f} ms):")
+    for key, value in settings.items():
+        print(f"{key}={value}")
+    if args.env_file:
+        write_env_file(args.env_file, settings)
+        print(f"Written to {args.env_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
 from dotenv import load_dotenv
+from slow_query import TimedCursor
 
 # Load environment variables
 load_dotenv()
@@ -16,7 +17,7 @@ db_params = {
 }
 
 def count_users():
-    conn = psycopg2.connect(**db_params)
+    conn = psycopg2.connect(**db_params, cursor_factory=TimedCursor)
     cur = conn.cursor()
     cur.execute("SELECT COUNT(*) FROM users")
     user_count = cur.fetchone()[0]
@@ -25,7 +26,7 @@ def count_users():
     return user_count
 
 def get_all_emails():
-    conn = psycopg2.connect(**db_params)
+    conn = psycopg2.connect(**db_params, cursor_factory=TimedCursor)
     cur = conn.cursor()
     cur.execute("SELECT email FROM users")
     emails = cur.fetchall()
@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from dotenv import load_dotenv
+
+from slow_query import TimedCursor
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Database connection parameters shared by server.py and blog_server.py
+db_params = {
+    'user': os.getenv("DB_USER", "postgres"),
+    'host': os.getenv("DB_HOST", "localhost"),
+    'database': os.getenv("DB_NAME", "dahwin"),
+    'password': os.getenv("DB_PASSWORD", "5779ra"),
+    'port': int(os.getenv("DB_PORT", 5432)),
+}
+
+# Pool sizing
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", 30))
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe psycopg2 connection pool with checkout health checks and stats."""
+
+    def __init__(self, params, minconn=1, maxconn=10, timeout=10.0, ping_after=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.params = params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = []  # list of (conn, returned_at)
+        self._in_use = set()
+        self._opened = False
+        self._closed = False
+
+        # Stats
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _connect(self):
+        # Statements over SLOW_QUERY_MS are logged (see slow_query.py)
+        return psycopg2.connect(**self.params, cursor_factory=TimedCursor)
+
+    def _open(self):
+        # Called with the lock held; pre-fills the pool on first use so that
+        # importing the apps does not require a reachable database.
+        self._opened = True
+        for _ in range(self.minconn):
+            try:
+                self._idle.append((self._connect(), time.monotonic()))
+            except psycopg2.Error as e:
+                logger.error(f"Unable to pre-fill connection pool: {e}")
+                break
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use)
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to `timeout` seconds for one."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            if self._closed:
+                raise psycopg2.InterfaceError("connection pool is closed")
+            if not self._opened:
+                self._open()
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    # Release the lock while pinging so other threads are not held up
+                    self._in_use.add(conn)
+                    self._cond.release()
+                    try:
+                        healthy = self._is_healthy(conn, time.monotonic() - returned_at)
+                    finally:
+                        self._cond.acquire()
+                    if healthy:
+                        break
+                    self._in_use.discard(conn)
+                    self._discard(conn)
+                    continue
+                if self._size() < self.maxconn:
+                    # Reserve the slot before connecting outside the lock
+                    placeholder = object()
+                    self._in_use.add(placeholder)
+                    self._cond.release()
+                    try:
+                        conn = self._connect()
+                    except psycopg2.Error:
+                        self._cond.acquire()
+                        self._in_use.discard(placeholder)
+                        self._cond.notify()
+                        raise
+                    self._cond.acquire()
+                    self._in_use.discard(placeholder)
+                    self._in_use.add(conn)
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"(max={self.maxconn})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            waited = time.monotonic() - start
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, rolling back any open transaction."""
+        if not conn.closed and not discard:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        with self._cond:
+            self._in_use.discard(conn)
+            if discard or conn.closed or self._closed or len(self._idle) >= self.maxconn:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that always gives the connection back, even if the body raises."""
+        conn = self.getconn()
+        try:
+            yield conn
+        except BaseException:
+            # Broken connections are dropped; healthy ones are rolled back and reused
+            self.putconn(conn, discard=bool(conn.closed))
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size(),
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "checkout_wait_avg_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "checkout_wait_max_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+pool = ConnectionPool(
+    db_params,
+    minconn=DB_POOL_MIN,
+    maxconn=DB_POOL_MAX,
+    timeout=DB_POOL_TIMEOUT,
+    ping_after=DB_POOL_PING_AFTER,
+)
+
+
+def get_db_connection():
+    """Borrow a pooled connection: `with get_db_connection() as conn: ...`"""
+    return pool.connection()
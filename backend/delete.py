@@ -2,6 +2,7 @@ import psycopg2
 from psycopg2.extras import RealDictCursor
 import os
 from dotenv import load_dotenv
+from slow_query import TimedCursor
 
 # Load environment variables
 load_dotenv()
@@ -17,7 +18,7 @@ db_params = {
 
 # Function to count users
 def count_users():
-    conn = psycopg2.connect(**db_params)
+    conn = psycopg2.connect(**db_params, cursor_factory=TimedCursor)
     cur = conn.cursor()
     cur.execute("SELECT COUNT(*) FROM users")
     user_count = cur.fetchone()[0]
@@ -27,7 +28,7 @@ def count_users():
 
 # Function to get all emails
 def get_all_emails():
-    conn = psycopg2.connect(**db_params)
+    conn = psycopg2.connect(**db_params, cursor_factory=TimedCursor)
     cur = conn.cursor()
     cur.execute("SELECT email FROM users")
     emails = cur.fetchall()
@@ -37,7 +38,7 @@ def get_all_emails():
 
 # Function to delete all users
 def delete_all_users():
-    conn = psycopg2.connect(**db_params)
+    conn = psycopg2.connect(**db_params, cursor_factory=TimedCursor)
     cur = conn.cursor()
     cur.execute("DELETE FROM users")
     conn.commit()  # Commit the transaction to save changes
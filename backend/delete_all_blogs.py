@@ -24,6 +24,10 @@ def delete_all_blog_posts():
         
         # Delete all blog posts
         cur.execute("DELETE FROM blog_posts")
+        # No post references any media now; let gc_media.py reclaim the files
+        cur.execute("SELECT to_regclass('media_blobs')")
+        if cur.fetchone()[0] is not None:
+            cur.execute("UPDATE media_blobs SET refcount = 0, updated_at = CURRENT_TIMESTAMP WHERE refcount > 0")
         conn.commit()
         
         logger.info("✅ Successfully deleted all blog posts!")
@@ -0,0 +1,168 @@
+"""Export the blog as static JSON files for a plain file server or CDN.
+
+    python export_static.py [--out static_export] [--page-size 20] [--full]
+
+Writes, with precompressed .gz and .br (if the brotli package is installed) siblings:
+
+    posts/<slug>.json   same body as /api/blog/slug/<slug>
+    pages/<n>.json      {"page", "pages", "next", "posts"} with posts as in /api/bloglist?view=summary
+
+Runs are incremental: manifest.json records a hash per post id and per page,
+and only posts whose row changed and pages whose rendered bytes changed are
+rewritten. Files of deleted posts and surplus pages are removed. Media under
+/all_data is not copied; serve it from UPLOAD_DIR as before.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+
+import orjson
+
+from blog_queries import BLOG_POST_COLUMNS, BLOGLIST_COLUMNS, format_list_row
+from db import get_db_connection
+from fast_json import json_fragment
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+# Changes whenever anything that ends up in posts/<slug>.json changes
+ROW_HASH = "md5(concat_ws('|', title, slug, created_at::text, content::text))"
+
+
+def write_file(out_dir, rel_path, body: bytes):
+    """Write `body` and its .gz/.br variants atomically."""
+    path = os.path.join(out_dir, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variants = {"": body, ".gz": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(body, quality=11)
+    for suffix, data in variants.items():
+        tmp_path = f"{path}{suffix}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path + suffix)
+
+
+def remove_file(out_dir, rel_path):
+    for suffix in ("", ".gz", ".br"):
+        try:
+            os.unlink(os.path.join(out_dir, rel_path + suffix))
+        except FileNotFoundError:
+            pass
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"posts": {}, "pages": {}}
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def export_posts(cur, out_dir, manifest):
+    """Rewrite changed posts and drop deleted ones; returns the number of files written."""
+    cur.execute(f"SELECT id, slug, {ROW_HASH} FROM blog_posts WHERE slug IS NOT NULL")
+    current = {str(post_id): {"slug": slug, "hash": row_hash} for post_id, slug, row_hash in cur.fetchall()}
+    previous = manifest["posts"]
+
+    for post_id, entry in previous.items():
+        if current.get(post_id, {}).get("slug") != entry["slug"]:
+            remove_file(out_dir, f"posts/{entry['slug']}.json")
+
+    changed = [int(post_id) for post_id, entry in current.items() if previous.get(post_id) != entry]
+    if changed:
+        # Only changed rows are fetched in full
+        cur.execute(f"SELECT {BLOG_POST_COLUMNS} FROM blog_posts WHERE id = ANY(%s)", (changed,))
+        columns = [col.name for col in cur.description]
+        for row in cur.fetchall():
+            post = dict(zip(columns, row))
+            post["content"] = json_fragment(post["content"])
+            write_file(out_dir, f"posts/{post['slug']}.json", orjson.dumps(post))
+
+    manifest["posts"] = current
+    return len(changed)
+
+
+def export_pages(cur, out_dir, manifest, page_size):
+    """Render every list page and rewrite those whose bytes changed; returns the number written."""
+    cur.execute(f"SELECT {BLOGLIST_COLUMNS['summary']} FROM blog_posts ORDER BY created_at DESC, id DESC")
+    columns = [col.name for col in cur.description]
+    posts = [format_list_row(dict(zip(columns, row))) for row in cur.fetchall()]
+
+    total = max(1, math.ceil(len(posts) / page_size))
+    previous = manifest["pages"]
+    current = {}
+    written = 0
+    for page in range(1, total + 1):
+        rel_path = f"pages/{page}.json"
+        body = orjson.dumps({
+            "page": page,
+            "pages": total,
+            "next": f"{page + 1}.json" if page < total else None,
+            "posts": posts[(page - 1) * page_size:page * page_size],
+        })
+        current[rel_path] = hashlib.sha256(body).hexdigest()
+        if previous.get(rel_path) != current[rel_path]:
+            write_file(out_dir, rel_path, body)
+            written += 1
+    for rel_path in previous.keys() - current.keys():
+        remove_file(out_dir, rel_path)
+
+    manifest["pages"] = current
+    return written
+
+
+def export_static(out_dir, page_size, full=False):
+    manifest = {"posts": {}, "pages": {}} if full else load_manifest(out_dir)
+    if manifest.get("page_size") != page_size:
+        # Page boundaries moved, so every page has to be rendered again
+        manifest["pages"] = dict.fromkeys(manifest["pages"])
+    manifest["page_size"] = page_size
+    if brotli is None:
+        logger.warning("brotli is not installed; writing .gz variants only")
+
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            posts_written = export_posts(cur, out_dir, manifest)
+            pages_written = export_pages(cur, out_dir, manifest, page_size)
+        except Exception as e:
+            logger.error(f"❌ Error exporting blog: {str(e)}")
+            raise
+        finally:
+            cur.close()
+
+    os.makedirs(out_dir, exist_ok=True)
+    save_manifest(out_dir, manifest)
+    logger.info(
+        f"✅ Exported to {out_dir}: {posts_written} of {len(manifest['posts'])} posts, "
+        f"{pages_written} of {len(manifest['pages'])} pages rewritten"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the blog as static JSON files")
+    parser.add_argument("--out", default="static_export", help="Output directory")
+    parser.add_argument("--page-size", type=int, default=20, help="Posts per list page")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and rewrite everything")
+    args = parser.parse_args()
+
+    export_static(args.out, args.page_size, full=args.full)
@@ -0,0 +1,29 @@
+import json
+
+import orjson
+from fastapi.responses import JSONResponse
+
+from metrics import phase
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson; datetimes come out as ISO 8601 without a jsonable_encoder pass."""
+
+    def render(self, content) -> bytes:
+        with phase("json"):
+            return orjson.dumps(content)
+
+
+def json_fragment(text: str):
+    """Embed JSON text rendered by Postgres (e.g. `content::text`) without decoding it.
+
+    A JSONB string holding a JSON document (old double-encoded rows) is decoded
+    the slow way so clients still get a list of blocks.
+    """
+    if text.startswith('"'):
+        value = json.loads(text)
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return [{'type': 'text', 'content': value}]
+    return orjson.Fragment(text)
@@ -0,0 +1,200 @@
+"""Remove media files in UPLOAD_DIR that no blog post references.
+
+    python gc_media.py [--grace-hours 24] [--dry-run] [--quarantine]
+
+Post content is streamed through a server-side cursor to build the set of
+referenced paths; derivatives count as referenced while their source blob
+is. Unreferenced files older than the grace period, and stale temp files,
+are deleted, or moved under .quarantine/ with --quarantine. Blobs whose
+media_blobs refcount changed within the grace period are never touched,
+which covers posts committed while the scan ran; older counts are stale
+(e.g. left by delete_all_blogs.py or a manual DELETE) and are ignored.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+from db import get_db_connection
+from media_derivatives import DERIVED_DIR
+from media_store import MEDIA_URL_PREFIX, TMP_DIR, UPLOAD_DIR
+from upload_sessions import SESSIONS_DIR
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+QUARANTINE_DIR = os.path.join(UPLOAD_DIR, ".quarantine")
+FETCH_BATCH = 500
+
+
+def block_urls(block):
+    """Every media URL a block points at: the file itself plus recorded derivatives."""
+    yield block.get('content')
+    yield block.get('thumbnail')
+    for variant in block.get('variants') or []:
+        yield variant.get('url')
+
+
+def referenced_paths(conn):
+    """Paths under UPLOAD_DIR referenced by any post, streamed in FETCH_BATCH rows at a time."""
+    prefix = MEDIA_URL_PREFIX + "/"
+    paths = set()
+    # Named cursor: rows stay on the server and arrive in batches
+    cur = conn.cursor(name="gc_media_posts")
+    cur.itersize = FETCH_BATCH
+    try:
+        cur.execute("SELECT content::text FROM blog_posts")
+        for (content,) in cur:
+            try:
+                blocks = json.loads(content)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(blocks, str):
+                # Old double-encoded rows
+                try:
+                    blocks = json.loads(blocks)
+                except json.JSONDecodeError:
+                    continue
+            for block in blocks if isinstance(blocks, list) else []:
+                if isinstance(block, dict):
+                    for url in block_urls(block):
+                        if isinstance(url, str) and url.startswith(prefix):
+                            paths.add(url[len(prefix):])
+    finally:
+        cur.close()
+    return paths
+
+
+def pending_upload_paths():
+    """Blobs of finalized upload sessions that a post may still be about to reference."""
+    paths = set()
+    if os.path.isdir(SESSIONS_DIR):
+        for upload_id in os.listdir(SESSIONS_DIR):
+            try:
+                with open(os.path.join(SESSIONS_DIR, upload_id, "meta.json")) as f:
+                    blob = json.load(f).get("blob")
+            except (OSError, ValueError):
+                continue
+            if blob:
+                paths.add(blob["path"])
+    return paths
+
+
+def is_referenced(rel_path, referenced, digests):
+    if rel_path in referenced:
+        return True
+    parts = rel_path.split("/")
+    # derived/<aa>/<bb>/<digest>/<variant> lives as long as its source blob
+    return len(parts) == 5 and parts[0] == DERIVED_DIR and parts[3] in digests
+
+
+def find_candidates(referenced, cutoff):
+    """Unreferenced files (and stale temp files) last modified before `cutoff`."""
+    digests = {os.path.splitext(os.path.basename(path))[0] for path in referenced}
+    candidates = []
+    kept_young = 0
+    for root, dirs, files in os.walk(UPLOAD_DIR):
+        rel_root = os.path.relpath(root, UPLOAD_DIR)
+        if rel_root == ".":
+            # Upload sessions expire on their own; never walk into the quarantine
+            dirs[:] = [d for d in dirs if not d.startswith(".") or os.path.join(root, d) == TMP_DIR]
+        for name in files:
+            full_path = os.path.join(root, name)
+            rel_path = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, "/")
+            in_tmp = os.path.commonpath([TMP_DIR, full_path]) == os.path.normpath(TMP_DIR)
+            if not in_tmp and is_referenced(rel_path, referenced, digests):
+                continue
+            try:
+                st = os.stat(full_path)
+            except FileNotFoundError:
+                continue
+            if st.st_mtime >= cutoff:
+                kept_young += 1
+                continue
+            candidates.append((rel_path, st.st_size))
+    return candidates, kept_young
+
+
+def still_counted(conn, paths, grace_hours):
+    """Paths media_blobs says are referenced, e.g. by a post committed after the scan.
+
+    Only counts changed within the grace period are trusted: a count that has
+    not moved for longer belongs to posts the scan would have seen, so if the
+    scan found no reference the posts were deleted without releasing it.
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT path FROM media_blobs
+            WHERE path = ANY(%s) AND refcount > 0 AND updated_at > now() - %s * interval '1 hour'
+        """, (paths, grace_hours))
+        return {row[0] for row in cur.fetchall()}
+    finally:
+        cur.close()
+
+
+def gc_media(grace_hours, dry_run=False, quarantine=False):
+    cutoff = time.time() - grace_hours * 3600
+    quarantine_root = os.path.join(QUARANTINE_DIR, datetime.now().strftime("%Y%m%d-%H%M%S"))
+
+    with get_db_connection() as conn:
+        try:
+            referenced = referenced_paths(conn) | pending_upload_paths()
+            candidates, kept_young = find_candidates(referenced, cutoff)
+            protected = still_counted(conn, [path for path, _ in candidates], grace_hours)
+            removed = []
+            for rel_path, size in candidates:
+                if rel_path in protected:
+                    continue
+                if not dry_run:
+                    full_path = os.path.join(UPLOAD_DIR, rel_path)
+                    try:
+                        if quarantine:
+                            os.renames(full_path, os.path.join(quarantine_root, rel_path))
+                        else:
+                            os.unlink(full_path)
+                    except FileNotFoundError:
+                        continue
+                removed.append((rel_path, size))
+
+            if removed and not dry_run:
+                cur = conn.cursor()
+                try:
+                    # Stale counts go with their files; a count bumped since the check keeps its row
+                    cur.execute("""
+                        DELETE FROM media_blobs
+                        WHERE path = ANY(%s) AND (refcount = 0 OR updated_at <= now() - %s * interval '1 hour')
+                    """, ([path for path, _ in removed], grace_hours))
+                    conn.commit()
+                finally:
+                    cur.close()
+        except Exception as e:
+            logger.error(f"❌ Error collecting media: {str(e)}")
+            conn.rollback()
+            raise
+
+    reclaimed = sum(size for _, size in removed)
+    action = "Would remove" if dry_run else ("Quarantined" if quarantine else "Removed")
+    for rel_path, size in removed:
+        logger.info(f"{action} {rel_path} ({size} bytes)")
+    logger.info(
+        f"✅ {action} {len(removed)} files, {reclaimed / 1024 / 1024:.1f} MiB reclaimed "
+        f"({len(referenced)} referenced paths, {kept_young} unreferenced files within the "
+        f"{grace_hours}h grace period, {len(protected)} recently counted in media_blobs)"
+    )
+    if quarantine and removed and not dry_run:
+        logger.info(f"Quarantined files are under {quarantine_root}")
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete or quarantine unreferenced media files")
+    parser.add_argument("--grace-hours", type=float, default=24, help="Only touch files older than this")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be removed")
+    parser.add_argument("--quarantine", action="store_true", help=f"Move files under {QUARANTINE_DIR} instead of deleting")
+    args = parser.parse_args()
+
+    gc_media(args.grace_hours, dry_run=args.dry_run, quarantine=args.quarantine)
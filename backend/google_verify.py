@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import re
+import time
+
+from google.auth import jwt as google_jwt
+from google.auth.transport import requests as google_requests
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_OAUTH2_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleCertSource:
+    """Fetches Google's signing certificates over HTTP (blocking)."""
+
+    def __init__(self, url=GOOGLE_OAUTH2_CERTS_URL, default_max_age=3600):
+        self.url = url
+        self.default_max_age = default_max_age
+        self._request = google_requests.Request()
+
+    def fetch(self):
+        """Return ({kid: pem_cert}, max_age_seconds) honouring Cache-Control and Age."""
+        response = self._request(self.url, method="GET")
+        if response.status != 200:
+            raise ValueError(f"Could not fetch certificates at {self.url}: HTTP {response.status}")
+        certs = json.loads(response.data.decode("utf-8"))
+        headers = {k.lower(): v for k, v in response.headers.items()}
+        match = _MAX_AGE_RE.search(headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else self.default_max_age
+        max_age -= int(headers.get("age", 0) or 0)
+        return certs, max(max_age, 0)
+
+
+class FileCertSource:
+    """Reads a {kid: pem_cert} JSON file, e.g. a local stand-in key set for offline testing."""
+
+    def __init__(self, path, max_age=3600):
+        self.path = path
+        self.max_age = max_age
+
+    def fetch(self):
+        with open(self.path) as f:
+            return json.load(f), self.max_age
+
+
+class StaticCertSource:
+    """Serves a fixed in-memory key set."""
+
+    def __init__(self, certs, max_age=3600):
+        self.certs = certs
+        self.max_age = max_age
+
+    def fetch(self):
+        return dict(self.certs), self.max_age
+
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens against an in-memory cert cache that is refreshed in the background."""
+
+    def __init__(self, client_id, source=None, refresh_margin=300, retry_interval=30, clock_skew=10,
+                 min_refresh_interval=60):
+        self.client_id = client_id
+        self.source = source or GoogleCertSource()
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.clock_skew = clock_skew
+        # Unknown key ids force at most one fetch per this many seconds
+        self.min_refresh_interval = min_refresh_interval
+        self._certs = None
+        self._max_age = 0
+        self._expires_at = 0.0
+        self._fetched_at = float("-inf")
+        self._lock = None
+        self._refresh_task = None
+
+    def _get_lock(self):
+        # Created lazily so the lock binds to the running event loop
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def refresh(self):
+        """Fetch the key set off the event loop and replace the cached copy."""
+        async with self._get_lock():
+            return await self._fetch()
+
+    async def _fetch(self):
+        # Caller holds the lock
+        certs, max_age = await asyncio.to_thread(self.source.fetch)
+        self._certs = certs
+        self._max_age = max_age
+        self._fetched_at = time.monotonic()
+        self._expires_at = self._fetched_at + max_age
+        logger.info(f"Loaded {len(certs)} Google signing certs, valid for {max_age}s")
+        return certs
+
+    async def _refresh_for_kid(self, kid):
+        """Refetch after a key rotation, unless the key set was fetched too recently to have changed."""
+        async with self._get_lock():
+            if kid in self._certs:
+                # Another request refreshed while we waited for the lock
+                return self._certs
+            if time.monotonic() - self._fetched_at < self.min_refresh_interval:
+                raise ValueError(f"Token signed with unknown key id {kid}")
+            return await self._fetch()
+
+    async def get_certs(self):
+        if self._certs is None or time.monotonic() >= self._expires_at:
+            return await self.refresh()
+        return self._certs
+
+    def _decode(self, token, certs):
+        idinfo = google_jwt.decode(
+            token,
+            certs=certs,
+            audience=self.client_id,
+            clock_skew_in_seconds=self.clock_skew,
+        )
+        if idinfo.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer. 'iss' should be one of the following: {GOOGLE_ISSUERS}")
+        return idinfo
+
+    async def verify(self, token):
+        """Return the token's claims; raises ValueError like id_token.verify_oauth2_token."""
+        certs = await self.get_certs()
+        kid = google_jwt.decode_header(token).get("kid")
+        if kid is not None and kid not in certs:
+            # Google rotated its keys ahead of our cached expiry, or the token is forged
+            certs = await self._refresh_for_kid(kid)
+        # RSA verification is CPU work; keep it off the loop as well
+        return await asyncio.to_thread(self._decode, token, certs)
+
+    async def _refresh_loop(self):
+        while True:
+            delay = self._expires_at - time.monotonic() - self.refresh_margin
+            if self._certs is None:
+                delay = 0
+            else:
+                # A max-age at or below the margin must not turn into a fetch loop
+                delay = max(delay, min(self.retry_interval, max(self._max_age / 2, 1)))
+            await asyncio.sleep(max(delay, 0))
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing Google certs: {e}")
+                await asyncio.sleep(self.retry_interval)
+
+    def start(self):
+        """Start refreshing the key set in the background ahead of its expiry."""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from metrics import phase
+
+logger = logging.getLogger(__name__)
+
+# Number of worker processes doing argon2/bcrypt work
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", os.cpu_count() or 1))
+# Requests allowed to wait for a free worker before we start answering 503
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", 64))
+
+# Argon2 cost parameters, normally produced by calibrate_hash.py. Unset values
+# fall back to the passlib defaults.
+ARGON2_TIME_COST = os.getenv("ARGON2_TIME_COST")
+ARGON2_MEMORY_COST = os.getenv("ARGON2_MEMORY_COST")  # KiB
+ARGON2_PARALLELISM = os.getenv("ARGON2_PARALLELISM")
+
+
+def argon2_settings():
+    settings = {}
+    if ARGON2_TIME_COST:
+        settings["argon2__rounds"] = int(ARGON2_TIME_COST)
+        # Hashes made with fewer passes are reported by needs_update()
+        settings["argon2__min_rounds"] = int(ARGON2_TIME_COST)
+    if ARGON2_MEMORY_COST:
+        settings["argon2__memory_cost"] = int(ARGON2_MEMORY_COST)
+    if ARGON2_PARALLELISM:
+        settings["argon2__parallelism"] = int(ARGON2_PARALLELISM)
+    return settings
+
+
+# Password hashing; bcrypt is only kept to verify (and then upgrade) legacy rows
+pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto", **argon2_settings())
+
+
+class HashQueueFull(Exception):
+    """Raised when the hashing pool already has HASH_WORKERS + HASH_QUEUE_SIZE jobs in flight."""
+
+
+# These run inside the worker processes and must stay top-level so they can be pickled
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _verify_and_update(plain_password, hashed_password):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+class HashingPool:
+    """Bounded process pool for password hashing and verification."""
+
+    def __init__(self, workers, queue_size):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn keeps the workers free of the event loop and DB sockets of the parent
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    async def run(self, fn, *args):
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self._rejected += 1
+                raise HashQueueFull(f"{self._in_flight} hashing jobs already in flight")
+            self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with phase("hash"):
+                return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - self.workers),
+                "rejected": self._rejected,
+            }
+
+
+hashing_pool = HashingPool(HASH_WORKERS, HASH_QUEUE_SIZE)
+
+
+async def hash_password(password: str) -> str:
+    return await hashing_pool.run(_hash, password)
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(_verify, plain_password, hashed_password)
+
+
+async def verify_and_update(plain_password: str, hashed_password: str):
+    """Return (valid, new_hash); new_hash is set when the stored hash should be replaced."""
+    return await hashing_pool.run(_verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,63 @@
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from cache import TTLCache
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+
+class ResponseCache:
+    """Caches serialized GET responses by URL and answers If-None-Match with 304."""
+
+    def __init__(self, maxsize=512, ttl=300.0, cache_control="public, max-age=30"):
+        self.cache_control = cache_control
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def respond(self, request: Request, build):
+        """Serve `request` from the cache, awaiting `build()` (which returns a Response) on a miss.
+
+        Only 200 responses are cached; anything `build` raises propagates untouched.
+        """
+        key = request.url.path + "?" + str(request.query_params)
+        entry = self._cache.get(key)
+        if entry is None:
+            response = await build()
+            body = bytes(response.body)
+            headers = {
+                k: v for k, v in response.headers.items()
+                if k.lower() not in ("content-length", "content-type")
+            }
+            headers["ETag"] = make_etag(body)
+            headers["Cache-Control"] = self.cache_control
+            entry = (response.status_code, body, response.media_type, headers)
+            if response.status_code == 200:
+                self._cache.set(key, entry)
+
+        status_code, body, media_type, headers = entry
+        if status_code == 200 and etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers={
+                "ETag": headers["ETag"],
+                "Cache-Control": headers["Cache-Control"],
+            })
+        return Response(content=body, status_code=status_code, media_type=media_type, headers=headers)
+
+    def invalidate(self):
+        """Drop every cached response; called whenever posts are created, changed or deleted."""
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
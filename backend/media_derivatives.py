@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from async_db import get_async_connection
+from media_store import MEDIA_URL_PREFIX, UPLOAD_DIR, is_blob_url
+
+logger = logging.getLogger(__name__)
+
+# Derivatives live next to the blobs: all_data/derived/<aa>/<bb>/<digest>/w640.webp
+DERIVED_DIR = "derived"
+THUMBNAIL_SIZE = int(os.getenv("MEDIA_THUMBNAIL_SIZE", 320))
+RESPONSIVE_WIDTHS = [int(w) for w in os.getenv("MEDIA_RESPONSIVE_WIDTHS", "640,1280,1920").split(",")]
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", 2))
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+def _save(image, rel_path, fmt):
+    path = os.path.join(UPLOAD_DIR, rel_path)
+    # Content-addressed sources never change, so an existing derivative is final
+    if not os.path.exists(path):
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        if fmt == "webp":
+            image.save(tmp_path, "WEBP", quality=WEBP_QUALITY, method=4)
+        elif fmt == "png":
+            image.save(tmp_path, "PNG", optimize=True)
+        else:
+            image.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_path, path)
+    return f"{MEDIA_URL_PREFIX}/{rel_path}"
+
+
+def generate_derivatives(source_rel_path):
+    """Write thumbnail, responsive widths and WebP variants for one blob (runs in a worker process)."""
+    from PIL import Image, ImageOps
+
+    digest = os.path.splitext(os.path.basename(source_rel_path))[0]
+    out_dir = f"{DERIVED_DIR}/{digest[:2]}/{digest[2:4]}/{digest}"
+    os.makedirs(os.path.join(UPLOAD_DIR, out_dir), exist_ok=True)
+
+    with Image.open(os.path.join(UPLOAD_DIR, source_rel_path)) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    fallback = "png" if has_alpha else "jpeg"
+    width, height = image.size
+
+    variants = []
+    for target in sorted(w for w in RESPONSIVE_WIDTHS if w < width):
+        resized = image.resize((target, round(height * target / width)), Image.LANCZOS)
+        for fmt in ("webp", fallback):
+            ext = "jpg" if fmt == "jpeg" else fmt
+            url = _save(resized, f"{out_dir}/w{target}.{ext}", fmt)
+            variants.append({"width": target, "height": resized.height, "format": fmt, "url": url})
+
+    thumb = image.copy()
+    thumb.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+    return {
+        "width": width,
+        "height": height,
+        "thumbnail": _save(thumb, f"{out_dir}/thumb.webp", "webp"),
+        "variants": variants,
+    }
+
+
+def build_srcset(block, fmt="webp"):
+    """`srcset` attribute value for an image block that has derivatives recorded."""
+    variants = [v for v in block.get("variants", []) if v["format"] == fmt]
+    if not variants:
+        return None
+    entries = [f"{v['url']} {v['width']}w" for v in variants]
+    if block.get("width"):
+        entries.append(f"{block['content']} {block['width']}w")
+    return ", ".join(entries)
+
+
+async def record_derivatives(url, meta):
+    """Merge derivative metadata into every image block, in any post, that shows `url`."""
+    async with get_async_connection() as conn:
+        status = await conn.execute("""
+            UPDATE blog_posts SET content = (
+                SELECT jsonb_agg(
+                    CASE WHEN elem->>'type' = 'image' AND elem->>'content' = $1
+                         THEN elem || $2::jsonb ELSE elem END
+                    ORDER BY ord)
+                FROM jsonb_array_elements(content) WITH ORDINALITY AS t(elem, ord)
+            )
+            WHERE content @> $3::jsonb
+        """, url, json.dumps(meta), json.dumps([{"content": url}]))
+    return int(status.split()[-1])
+
+
+class DerivativePipeline:
+    """Generates image derivatives in a process pool after the upload response has been sent."""
+
+    def __init__(self, workers, on_update=None):
+        self.workers = max(1, workers)
+        self.on_update = on_update
+        self._executor = None
+        self._tasks = set()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def schedule(self, blocks):
+        """Queue derivative generation for the image blocks of a just-saved post; returns immediately."""
+        loop = asyncio.get_running_loop()
+        for block in blocks:
+            url = block.get('content') or ""
+            if block.get('type') == 'image' and is_blob_url(url) and "variants" not in block:
+                task = loop.create_task(self._process(url))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, url):
+        loop = asyncio.get_running_loop()
+        rel_path = url[len(MEDIA_URL_PREFIX) + 1:]
+        try:
+            meta = await loop.run_in_executor(self._get_executor(), generate_derivatives, rel_path)
+            updated = await record_derivatives(url, meta)
+            logger.info(f"Generated {len(meta['variants'])} derivatives for {rel_path} ({updated} posts updated)")
+            if self.on_update is not None:
+                self.on_update()
+        except Exception as e:
+            logger.error(f"Error generating derivatives for {rel_path}: {str(e)}")
+
+    def pending(self):
+        return len(self._tasks)
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
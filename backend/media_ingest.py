@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from media_store import CHUNK_SIZE, TMP_DIR, place_blob, safe_extension, store_spooled
+from metrics import phase
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("MEDIA_INGEST_WORKERS", 4))
+# Limits are enforced before the bytes reach the blob store
+MAX_FILE_BYTES = int(os.getenv("MEDIA_MAX_FILE_BYTES", 512 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.getenv("MEDIA_MAX_REQUEST_BYTES", 1024 * 1024 * 1024))
+# Allowance on top of MAX_REQUEST_BYTES for form fields and multipart framing
+MAX_FORM_OVERHEAD = int(os.getenv("MEDIA_MAX_FORM_OVERHEAD", 1024 * 1024))
+# Part headers (Content-Disposition, Content-Type) counted against a file's size while streaming
+PART_HEADER_ALLOWANCE = 16 * 1024
+
+_BOUNDARY_RE = re.compile(rb'boundary="?([^";]+)"?')
+
+
+class UploadTooLarge(Exception):
+    """Raised when a file or the whole request goes over its size limit."""
+
+
+class _RequestBudget:
+    # Shared by the concurrent ingests of one request; only touched from the event loop
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+
+    def consume(self, n):
+        self.used += n
+        if self.used > self.limit:
+            raise UploadTooLarge(f"Request exceeds {self.limit} bytes of media")
+
+
+def _open_tmp():
+    os.makedirs(TMP_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=TMP_DIR, delete=False)
+
+
+def _write_chunk(tmp, sha, chunk):
+    sha.update(chunk)
+    tmp.write(chunk)
+
+
+def _discard(tmp):
+    tmp.close()
+    os.unlink(tmp.name)
+
+
+def _spool_file(upload):
+    """(fd, path) of the temp file Starlette spooled `upload` to, or None while it is in memory.
+
+    path is None for unnamed (O_TMPFILE) spool files, which cannot be linked.
+    """
+    spool = upload.file
+    if not getattr(spool, "_rolled", True):
+        return None
+    raw = getattr(spool, "_file", spool)
+    try:
+        fd = raw.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    name = getattr(raw, "name", None)
+    return fd, name if isinstance(name, str) and os.path.isfile(name) else None
+
+
+class _PartSizes:
+    """Tracks the size of the multipart part currently arriving, across body chunks."""
+
+    def __init__(self, boundary):
+        self.delimiter = b"\r\n--" + boundary
+        self.tail = b""
+        self.current = 0
+
+    def feed(self, chunk):
+        """Account `chunk`; returns the size of the largest part seen in it."""
+        data = self.tail + chunk
+        largest = 0
+        part_start = None
+        end = data.find(self.delimiter)
+        while end != -1:
+            if part_start is None:
+                # The part that was already arriving; the tail bytes were counted before
+                largest = self.current + end - len(self.tail)
+            else:
+                largest = max(largest, end - part_start)
+            part_start = end + len(self.delimiter)
+            end = data.find(self.delimiter, part_start)
+        if part_start is None:
+            self.current += len(chunk)
+        else:
+            self.current = len(data) - part_start
+        self.tail = data[-(len(self.delimiter) - 1):]
+        return max(largest, self.current)
+
+
+class RequestSizeLimit:
+    """ASGI middleware that enforces the media limits on multipart bodies while they arrive.
+
+    Starlette spools every File() part to disk before the handler runs, so the
+    checks in MediaIngest only see a request once it has been received in full.
+    This answers 413 from Content-Length up front, and otherwise counts the
+    bytes of the whole body and of the current part as they come in, aborting
+    the parse as soon as either goes over its limit.
+    """
+
+    def __init__(self, app, limit=MAX_REQUEST_BYTES + MAX_FORM_OVERHEAD,
+                 part_limit=MAX_FILE_BYTES + PART_HEADER_ALLOWANCE):
+        self.app = app
+        self.limit = limit
+        self.part_limit = part_limit
+
+    async def _reject(self, send, message):
+        body = json.dumps({"detail": message}).encode()
+        await send({"type": "http.response.start", "status": 413, "headers": [
+            (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+            (b"connection", b"close"),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        content_type = headers.get(b"content-type", b"")
+        if not content_type.startswith(b"multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+        try:
+            length = int(headers[b"content-length"])
+        except (KeyError, ValueError):
+            length = None
+        if length is not None and length > self.limit:
+            await self._reject(send, f"Request exceeds {self.limit} bytes")
+            return
+
+        boundary = _BOUNDARY_RE.search(content_type)
+        parts = _PartSizes(boundary.group(1)) if boundary else None
+        received = 0
+        exceeded = None
+        started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if received > self.limit:
+                    exceeded = f"Request exceeds {self.limit} bytes"
+                elif parts is not None and parts.feed(chunk) > self.part_limit:
+                    exceeded = f"A file exceeds {MAX_FILE_BYTES} bytes"
+                if exceeded:
+                    raise UploadTooLarge(exceeded)
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # Whatever the app made of the aborted parse is replaced by the 413 below
+                return
+            started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not started:
+            await self._reject(send, exceeded)
+
+
+class MediaIngest:
+    """Streams the files of an upload request to the blob store concurrently.
+
+    Files Starlette has spooled to disk are linked or kernel-copied into place
+    (see media_store.store_spooled); in-memory ones are read in async chunks.
+    Hashing and disk writes run in a thread pool so one slow file never holds
+    up the event loop or the others.
+    """
+
+    def __init__(self, workers, max_file_bytes=MAX_FILE_BYTES, max_request_bytes=MAX_REQUEST_BYTES):
+        self.workers = max(1, workers)
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self._executor = None
+        self._files = 0
+        self._bytes = 0
+        self._rejected = 0
+        self._methods = {}
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="media-ingest")
+        return self._executor
+
+    async def _ingest_one(self, upload, budget):
+        start = time.perf_counter()
+        spooled = _spool_file(upload)
+        # Files are ingested concurrently, so per-request "file" time can exceed wall time
+        with phase("file"):
+            if spooled is not None:
+                blob, method = await self._ingest_spooled(upload, budget, *spooled)
+            else:
+                blob, method = await self._ingest_streamed(upload, budget), "streamed"
+        elapsed = time.perf_counter() - start
+        self._files += 1
+        self._bytes += blob.size
+        self._methods[method] = self._methods.get(method, 0) + 1
+        logger.info(
+            f"Ingested {upload.filename} -> {blob.path} ({blob.size} bytes in {elapsed * 1000:.1f} ms, "
+            f"{blob.size / max(elapsed, 1e-9) / 1e6:.1f} MB/s, {method}, "
+            f"{'new' if blob.created else 'deduplicated'})"
+        )
+        return blob
+
+    async def _ingest_spooled(self, upload, budget, fd, path):
+        # Already on disk: the size is known up front and the bytes are not read back through Python
+        size = os.fstat(fd).st_size
+        if size > self.max_file_bytes:
+            raise UploadTooLarge(f"{upload.filename} exceeds {self.max_file_bytes} bytes")
+        budget.consume(size)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), store_spooled, fd, upload.filename, path)
+
+    async def _ingest_streamed(self, upload, budget):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        sha = hashlib.sha256()
+        size = 0
+        tmp = await loop.run_in_executor(executor, _open_tmp)
+        try:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_file_bytes:
+                    raise UploadTooLarge(f"{upload.filename} exceeds {self.max_file_bytes} bytes")
+                budget.consume(len(chunk))
+                await loop.run_in_executor(executor, _write_chunk, tmp, sha, chunk)
+            await loop.run_in_executor(executor, tmp.close)
+        except BaseException:
+            await asyncio.shield(loop.run_in_executor(executor, _discard, tmp))
+            raise
+        return await loop.run_in_executor(
+            executor, place_blob, tmp.name, sha.hexdigest(), size, safe_extension(upload.filename)
+        )
+
+    async def ingest(self, uploads):
+        """Store every upload; returns StoredBlobs in the same order or raises UploadTooLarge."""
+        budget = _RequestBudget(self.max_request_bytes)
+        tasks = [asyncio.create_task(self._ingest_one(upload, budget)) for upload in uploads]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException as e:
+            # Stop the remaining writes as soon as one file fails
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if isinstance(e, UploadTooLarge):
+                self._rejected += 1
+            raise
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "files": self._files,
+            "bytes": self._bytes,
+            "rejected_requests": self._rejected,
+            "methods": dict(self._methods),
+            "max_file_bytes": self.max_file_bytes,
+            "max_request_bytes": self.max_request_bytes,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
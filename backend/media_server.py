@@ -0,0 +1,170 @@
+import mimetypes
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+
+import anyio
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+
+from http_cache import etag_matches
+from media_store import UPLOAD_DIR
+
+# When set (e.g. "/_media"), responses only carry X-Accel-Redirect and the front
+# proxy streams the file from an internal location mapped onto UPLOAD_DIR.
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX")
+MEDIA_MAX_AGE = int(os.getenv("MEDIA_MAX_AGE", 3600))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 256 * 1024
+
+# Names that can never change content: content-addressed blobs and their
+# derivatives, and the legacy "<YYYYmmddHHMMSS>_<name>" uploads.
+_IMMUTABLE_RE = re.compile(
+    r"^(?:[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?"
+    r"|derived/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}/[\w.]+"
+    r"|\d{14}_[^/]+)$"
+)
+_DIGEST_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(?:\.\w+)?$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def resolve_media_path(path: str) -> str:
+    """Absolute path for a public media file, or 404 for anything outside UPLOAD_DIR or hidden."""
+    parts = path.split("/")
+    if not path or any(part in ("", ".", "..") or part.startswith(".") for part in parts):
+        raise HTTPException(status_code=404, detail="File not found")
+    root = os.path.realpath(UPLOAD_DIR)
+    full_path = os.path.realpath(os.path.join(root, *parts))
+    if os.path.commonpath([root, full_path]) != root:
+        raise HTTPException(status_code=404, detail="File not found")
+    return full_path
+
+
+def parse_range(header: str | None, size: int):
+    """Return (start, end) inclusive for a single satisfiable byte range, None to send the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple or malformed ranges: serving the full representation is allowed
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """Sends a byte range of a file, zero-copy when the server supports an ASGI file extension."""
+
+    def __init__(self, path, start, end, status_code, headers, media_type, send_body=True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.count = end - start + 1
+        self.send_body = send_body
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            # sendfile(2) performed by the server on our file descriptor
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": fd,
+                    "offset": self.start,
+                    "count": self.count,
+                })
+            finally:
+                os.close(fd)
+            return
+        if "http.response.pathsend" in extensions and self.start == 0 and self.count == os.path.getsize(self.path):
+            await send({"type": "http.response.pathsend", "path": self.path})
+            return
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.count
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # File shrank underneath us; end the response rather than hang
+            await send({"type": "http.response.body", "body": b""})
+
+
+def _not_modified_since(request: Request, mtime: float) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def serve_media(request: Request, path: str) -> Response:
+    full_path = resolve_media_path(path)
+    try:
+        st = os.stat(full_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    digest = _DIGEST_RE.match(path)
+    etag = f'"{digest.group(1)}"' if digest else f'"{int(st.st_mtime):x}-{st.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if _IMMUTABLE_RE.match(path) else f"public, max-age={MEDIA_MAX_AGE}",
+        "Accept-Ranges": "bytes",
+    }
+    media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) or (not if_none_match and _not_modified_since(request, st.st_mtime)):
+        return Response(status_code=304, headers=headers)
+
+    if MEDIA_ACCEL_REDIRECT_PREFIX:
+        # The proxy handles ranges and sendfile itself
+        headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{path}"
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range != etag and if_range != headers["Last-Modified"]:
+        # The client's partial copy is stale; send the whole file
+        range_header = None
+    try:
+        byte_range = parse_range(range_header, st.st_size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{st.st_size}"})
+
+    send_body = request.method != "HEAD"
+    if byte_range is None:
+        return FileRangeResponse(full_path, 0, st.st_size - 1, 200, headers, media_type, send_body)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+    return FileRangeResponse(full_path, start, end, 206, headers, media_type, send_body)
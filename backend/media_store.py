@@ -0,0 +1,206 @@
+import errno
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Directory served under MEDIA_URL_PREFIX by blog_server.py
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "all_data")
+MEDIA_URL_PREFIX = "/all_data"
+# In-progress writes live here so a crash never leaves a half-written blob in place
+TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+CHUNK_SIZE = 1024 * 1024
+
+_EXT_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+_BLOB_RE = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,10})?$")
+# copy_file_range errors that mean "not supported here" rather than a real I/O failure
+_NO_COPY_FILE_RANGE = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM, errno.EBADF}
+
+
+def _umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Temp files are created 0600; blobs get the mode a plain open() would give them,
+# so a proxy running as another user can serve them (0644 under umask 022)
+BLOB_MODE = 0o666 & ~_umask()
+
+
+@dataclass
+class StoredBlob:
+    digest: str
+    path: str  # relative to UPLOAD_DIR, e.g. "4e/5d/4e5d...f5.jpg"
+    size: int
+    created: bool  # False when identical content was already stored
+
+    @property
+    def url(self):
+        return f"{MEDIA_URL_PREFIX}/{self.path}"
+
+
+def safe_extension(filename: str | None) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if _EXT_RE.match(ext) else ""
+
+
+def blob_path(digest: str, ext: str = "") -> str:
+    """Sharded location of a blob: two levels of two hex characters each."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_blob_url(url: str) -> bool:
+    return url.startswith(MEDIA_URL_PREFIX + "/") and bool(_BLOB_RE.match(url[len(MEDIA_URL_PREFIX) + 1:]))
+
+
+def is_stored_url(url: str) -> bool:
+    """True for any media URL whose file exists under UPLOAD_DIR, including legacy <timestamp>_<name> files."""
+    if not url.startswith(MEDIA_URL_PREFIX + "/"):
+        return False
+    root = os.path.realpath(UPLOAD_DIR)
+    full_path = os.path.realpath(os.path.join(root, url[len(MEDIA_URL_PREFIX) + 1:]))
+    return os.path.commonpath([root, full_path]) == root and os.path.isfile(full_path)
+
+
+def _link_blob(src_path: str, digest: str, size: int, ext: str) -> StoredBlob:
+    path = blob_path(digest, ext)
+    final_path = os.path.join(UPLOAD_DIR, path)
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.chmod(src_path, BLOB_MODE)
+    try:
+        # link() fails instead of overwriting, so concurrent identical uploads are safe
+        os.link(src_path, final_path)
+        created = True
+    except FileExistsError:
+        # Refresh the mtime so gc_media's grace period covers the post that is about to reference it
+        os.utime(final_path)
+        created = False
+    return StoredBlob(digest=digest, path=path, size=size, created=created)
+
+
+def place_blob(tmp_path: str, digest: str, size: int, ext: str) -> StoredBlob:
+    """Move a fully written temp file into its content-addressed location (or drop it if present)."""
+    try:
+        return _link_blob(tmp_path, digest, size, ext)
+    finally:
+        os.unlink(tmp_path)
+
+
+def store_fileobj(fileobj, filename: str | None = None) -> StoredBlob:
+    """Stream `fileobj` to disk while hashing it and store it once under its SHA-256."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    sha = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=TMP_DIR, delete=False) as tmp:
+        try:
+            while chunk := fileobj.read(CHUNK_SIZE):
+                sha.update(chunk)
+                tmp.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    blob = place_blob(tmp.name, sha.hexdigest(), size, safe_extension(filename))
+    logger.info(f"Stored blob {blob.path} ({size} bytes, {'new' if blob.created else 'deduplicated'})")
+    return blob
+
+
+def _hash_fd(fd: int, size: int) -> str:
+    sha = hashlib.sha256()
+    offset = 0
+    while offset < size and (chunk := os.pread(fd, CHUNK_SIZE, offset)):
+        sha.update(chunk)
+        offset += len(chunk)
+    return sha.hexdigest()
+
+
+def _copy_fd(src_fd: int, dst_fd: int, size: int) -> str:
+    offset = 0
+    try:
+        # In-kernel copy; on CoW filesystems (btrfs, XFS) this is a reflink and moves no data
+        while offset < size and (n := os.copy_file_range(src_fd, dst_fd, size - offset, offset, offset)):
+            offset += n
+        return "copy_file_range"
+    except (AttributeError, OSError) as e:
+        if isinstance(e, OSError) and e.errno not in _NO_COPY_FILE_RANGE:
+            raise
+    # Chunked copy for older kernels and filesystems that do not support copy_file_range
+    os.ftruncate(dst_fd, 0)
+    offset = 0
+    while offset < size and (chunk := os.pread(src_fd, CHUNK_SIZE, offset)):
+        os.pwrite(dst_fd, chunk, offset)
+        offset += len(chunk)
+    return "chunked"
+
+
+def store_spooled(fd: int, filename: str | None = None, src_path: str | None = None) -> tuple[StoredBlob, str]:
+    """Store an upload that is already on disk without rewriting it through Python.
+
+    A spool file with a path on the upload filesystem is hard-linked into place;
+    otherwise it is copied with copy_file_range, falling back to a chunked copy.
+    Returns the blob and the method used.
+    """
+    size = os.fstat(fd).st_size
+    ext = safe_extension(filename)
+    if src_path is not None:
+        digest = _hash_fd(fd, size)
+        try:
+            return _link_blob(src_path, digest, size, ext), "link"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.ENOENT):
+                raise
+    os.makedirs(TMP_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=TMP_DIR, delete=False) as tmp:
+        try:
+            # Copy and hash side by side; both release the GIL, so this costs max() rather than sum()
+            with ThreadPoolExecutor(max_workers=1) as copier:
+                copied = copier.submit(_copy_fd, fd, tmp.fileno(), size)
+                digest = _hash_fd(fd, size)
+                method = copied.result()
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+    return place_blob(tmp.name, digest, size, ext), method
+
+
+def media_paths(blocks) -> list[str]:
+    """Blob paths (relative to UPLOAD_DIR) referenced by the media blocks of a post."""
+    paths = []
+    for block in blocks or []:
+        if isinstance(block, dict) and block.get('type') in ('image', 'video'):
+            url = block.get('content') or ""
+            if is_blob_url(url):
+                paths.append(url[len(MEDIA_URL_PREFIX) + 1:])
+    return paths
+
+
+async def add_references(conn, blobs):
+    """Count one more reference for each stored blob (run inside the post's transaction)."""
+    await conn.executemany("""
+        INSERT INTO media_blobs (path, digest, size, refcount)
+        VALUES ($1, $2, $3, 1)
+        ON CONFLICT (path) DO UPDATE SET refcount = media_blobs.refcount + 1, updated_at = CURRENT_TIMESTAMP
+    """, [(blob.path, blob.digest, blob.size) for blob in blobs])
+
+
+async def add_path_references(conn, paths):
+    """Count one more reference for blobs that are already recorded in media_blobs."""
+    await conn.executemany(
+        "UPDATE media_blobs SET refcount = refcount + 1, updated_at = CURRENT_TIMESTAMP WHERE path = $1",
+        [(path,) for path in paths],
+    )
+
+
+async def release_references(conn, paths):
+    """Drop one reference per path; blobs reaching zero are left for the media GC."""
+    await conn.executemany(
+        "UPDATE media_blobs SET refcount = GREATEST(refcount - 1, 0), updated_at = CURRENT_TIMESTAMP "
+        "WHERE path = $1",
+        [(path,) for path in paths],
+    )
@@ -0,0 +1,190 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Latency buckets in seconds, shared by request and phase histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("db", "hash", "json", "file")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds spent per phase by the current request; a dict so threads and tasks
+# started from the request (which get a copy of the context) add to the same totals
+_phase_times = contextvars.ContextVar("phase_times", default=None)
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to `name` for the current request."""
+    times = _phase_times.get()
+    if times is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        times[name] = times.get(name, 0.0) + time.perf_counter() - start
+
+
+def add_phase_time(name, seconds):
+    """Attribute time measured elsewhere (e.g. by a driver) to `name` for the current request."""
+    times = _phase_times.get()
+    if times is not None:
+        times[name] = times.get(name, 0.0) + seconds
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            # [per-bucket counts..., +Inf count, sum]
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{{{_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+class Metrics:
+    """In-process metrics for one app, rendered in the Prometheus text format."""
+
+    def __init__(self, app_name):
+        self.app_name = app_name
+        self._lock = threading.Lock()
+        self.in_progress = 0
+        self.duration = Histogram(
+            "http_request_duration_seconds", "Request latency by route.", ("app", "method", "route"))
+        self.phases = Histogram(
+            "http_request_phase_seconds", "Time spent per request in db, hash, json and file work.",
+            ("app", "route", "phase"))
+        self.responses = Counter(
+            "http_responses_total", "Responses by route and status code.", ("app", "method", "route", "status"))
+        self._collectors = {}
+
+    def add_collector(self, prefix, stats):
+        """Export the numeric values of `stats()` (e.g. pool or cache stats) as gauges named prefix_key."""
+        self._collectors[prefix] = stats
+
+    def record(self, method, route, status, elapsed, phase_times):
+        with self._lock:
+            self.duration.observe((self.app_name, method, route), elapsed)
+            self.responses.inc((self.app_name, method, route, str(status)))
+            for name, seconds in phase_times.items():
+                self.phases.observe((self.app_name, route, name), seconds)
+
+    def _gauges(self):
+        lines = [
+            "# TYPE http_requests_in_progress gauge",
+            f'http_requests_in_progress{{app="{self.app_name}"}} {self.in_progress}',
+        ]
+        for prefix, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f'{prefix}_{key}{{app="{self.app_name}"}} {value}')
+        return lines
+
+    def render(self) -> bytes:
+        with self._lock:
+            lines = self.duration.render() + self.phases.render() + self.responses.render()
+        return ("\n".join(lines + self._gauges()) + "\n").encode()
+
+    def endpoint(self, request: Request):
+        return Response(content=self.render(), media_type=CONTENT_TYPE)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request; the route label is the matched path template."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        times = {}
+        token = _phase_times.set(times)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_progress += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.metrics.in_progress -= 1
+            _phase_times.reset(token)
+            route = scope.get("route")
+            # Unmatched paths share one label so scanners cannot blow up the series count
+            route_path = getattr(route, "path", None) or "<unmatched>"
+            self.metrics.record(scope["method"], route_path, status, elapsed, times)
+
+
+def install(app, app_name, collectors=None):
+    """Add the middleware and a GET /metrics endpoint to a FastAPI app."""
+    metrics = Metrics(app_name)
+    for prefix, stats in (collectors or {}).items():
+        metrics.add_collector(prefix, stats)
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+    app.add_api_route("/metrics", metrics.endpoint, methods=["GET"], include_in_schema=False)
+    return metrics
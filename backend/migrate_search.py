@@ -0,0 +1,29 @@
+import logging
+
+from db import get_db_connection
+import blog_search
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def migrate_search():
+    """Create or update the full-text search column, trigger and index, backfilling old rows."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            for statement in blog_search.SCHEMA:
+                cur.execute(statement)
+            conn.commit()
+            logger.info("✅ Full-text search schema is up to date")
+        except Exception as e:
+            logger.error(f"❌ Error migrating search schema: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+
+
+if __name__ == "__main__":
+
+    migrate_search()
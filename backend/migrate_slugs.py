@@ -0,0 +1,34 @@
+import logging
+
+from db import get_db_connection
+from slugs import unique_slug
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def backfill_slugs():
+    """Give every blog post without a slug a unique one, oldest posts first."""
+    with get_db_connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("ALTER TABLE blog_posts ADD COLUMN IF NOT EXISTS slug VARCHAR(255)")
+            cur.execute("SELECT id, title FROM blog_posts WHERE slug IS NULL ORDER BY created_at, id")
+            rows = cur.fetchall()
+            for post_id, title in rows:
+                slug = unique_slug(cur, title)
+                cur.execute("UPDATE blog_posts SET slug = %s WHERE id = %s", (slug, post_id))
+            cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS blog_posts_slug_key ON blog_posts (slug)")
+            conn.commit()
+            logger.info(f"✅ Backfilled slugs for {len(rows)} blog posts")
+        except Exception as e:
+            logger.error(f"❌ Error backfilling slugs: {str(e)}")
+            conn.rollback()
+        finally:
+            cur.close()
+
+
+if __name__ == "__main__":
+
+    backfill_slugs()
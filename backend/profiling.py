@@ -0,0 +1,141 @@
+import asyncio
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Requests sent with "X-Profile: <PROFILE_TOKEN>" are profiled; empty disables the header
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# Fraction of all requests profiled without the header (0 = never)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", 1)) / 1000
+PROFILE_HEADER = b"x-profile"
+
+_UNSAFE_RE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _await_chain(coro):
+    """Frames of a suspended coroutine and everything it is awaiting, outermost first."""
+    frames = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+    return frames
+
+
+class RequestSampler:
+    """Samples the stack of one request's task from a background thread.
+
+    While the task runs, the event loop thread's stack is recorded; while it
+    is suspended, the chain of awaits it is blocked on is recorded with a
+    "[waiting]" leaf. The result is a wall-clock profile of that request only.
+    """
+
+    def __init__(self, task, interval=PROFILE_INTERVAL):
+        self.task = task
+        self.interval = interval
+        self.loop_thread_id = threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _sample(self):
+        coro = self.task.get_coro()
+        if getattr(coro, "cr_running", False):
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.reverse()
+        else:
+            stack = [_frame_name(frame) for frame in _await_chain(coro)] + ["[waiting]"]
+        self.samples[";".join(stack)] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except (RuntimeError, ValueError):
+                # The task changed state while being inspected; skip this tick
+                continue
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        """Write the samples in the collapsed-stack format read by flamegraph.pl and speedscope."""
+        with open(path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests carrying the admin header or picked by sampling."""
+
+    def __init__(self, app, app_name, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE, out_dir=PROFILE_DIR):
+        self.app = app
+        self.app_name = app_name
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+        self.out_dir = out_dir
+
+    def _wanted(self, scope):
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        started = time.time()
+        route = _UNSAFE_RE.sub("_", scope["path"].strip("/"))[:80] or "root"
+        filename = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(started))}-{self.app_name}-{scope['method']}-{route}-{os.getpid()}-{random.randrange(16 ** 4):04x}.collapsed"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-file", filename.encode())]}
+            await send(message)
+
+        sampler = RequestSampler(asyncio.current_task())
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            path = os.path.join(self.out_dir, filename)
+            sampler.write(path)
+            logger.info(
+                f"Profiled {scope['method']} {scope['path']} in {(time.time() - started) * 1000:.1f} ms "
+                f"({sum(sampler.samples.values())} samples) -> {path}"
+            )
+
+
+def install(app, app_name):
+    """Enable opt-in request profiling; costs one header scan per request while off."""
+    app.add_middleware(ProfilingMiddleware, app_name=app_name)
@@ -1,16 +1,22 @@
 from fastapi import FastAPI, HTTPException, Depends, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import time
+import asyncpg
 import os
 from dotenv import load_dotenv
-from google.oauth2 import id_token
-from google.auth.transport import requests
+from async_db import get_async_connection, async_pool
+import hashing
+from hashing import HashQueueFull, hashing_pool, pwd_context
+from cache import TTLCache
+import metrics
+import profiling
+from slow_query import slow_query_log
+from google_verify import FileCertSource, GoogleCertSource, GoogleTokenVerifier
 
 # Load environment variables
 load_dotenv()
@@ -32,24 +38,26 @@ SECRET_KEY = os.getenv("SECRET_KEY", "A1b78Qc5MjtdfO0jIfl9MPNHW7MiqCFQBaxrUWD51J
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30000
 
-# Password hashing
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
-
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# Database connection parameters
-db_params = {
-    'user': os.getenv("DB_USER", "postgres"),
-    'host': os.getenv("DB_HOST", "localhost"),
-    'database': os.getenv("DB_NAME", "dahwin"),
-    'password': os.getenv("DB_PASSWORD", "5779ra"),
-    'port': int(os.getenv("DB_PORT", 5432)),
-}
+# Short-lived caches for get_current_user: token -> email and email -> user row
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 4096))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+user_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
 # Google OAuth2 client ID
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "523322493045-4ev8g65gb1vddkem1idqf1e5igei10gh.apps.googleusercontent.com")
 
+# Google ID-token verification with a cached, background-refreshed cert set.
+# GOOGLE_CERTS_FILE points at a local {kid: pem} key set for offline testing.
+GOOGLE_CERTS_FILE = os.getenv("GOOGLE_CERTS_FILE")
+google_verifier = GoogleTokenVerifier(
+    GOOGLE_CLIENT_ID,
+    source=FileCertSource(GOOGLE_CERTS_FILE) if GOOGLE_CERTS_FILE else GoogleCertSource(),
+)
+
 # Pydantic models
 class UserSignup(BaseModel):
     first_name: str
@@ -75,19 +83,22 @@ class GoogleToken(BaseModel):
     token: str
 
 # Database functions
-def get_db_connection():
-    conn = psycopg2.connect(**db_params)
-    return conn
-
-def get_user(email: str):
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-    cur.execute("SELECT * FROM users WHERE email = %s", (email,))
-    user = cur.fetchone()
-    cur.close()
-    conn.close()
+async def get_user(email: str):
+    async with get_async_connection() as conn:
+        user = await conn.fetchrow("SELECT * FROM users WHERE email = $1", email)
+    return dict(user) if user is not None else None
+
+async def get_cached_user(email: str):
+    user = user_cache.get(email)
+    if user is None:
+        user = await get_user(email)
+        if user is not None:
+            user_cache.set(email, user)
     return user
 
+def invalidate_user(email: str):
+    user_cache.invalidate(email)
+
 # Authentication functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -95,12 +106,28 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def authenticate_user(email: str, password: str):
-    user = get_user(email)
-    if not user:
+async def update_password_hash(email: str, old_hash: str, new_hash: str):
+    async with get_async_connection() as conn:
+        # Only replace the hash we verified against, never a concurrently changed one
+        await conn.execute(
+            "UPDATE users SET password = $1 WHERE email = $2 AND password = $3",
+            new_hash, email, old_hash,
+        )
+    invalidate_user(email)
+
+async def authenticate_user(email: str, password: str):
+    user = await get_user(email)
+    if not user or not user['password']:
         return False
-    if not verify_password(password, user['password']):
+    valid, new_hash = await hashing.verify_and_update(password, user['password'])
+    if not valid:
         return False
+    if new_hash:
+        # Legacy bcrypt rows and argon2 hashes with outdated parameters are upgraded on login
+        try:
+            await update_password_hash(email, user['password'], new_hash)
+        except asyncpg.PostgresError as e:
+            print(f"Error upgrading password hash for {email}: {str(e)}")
     return user
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
@@ -119,15 +146,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    email = token_cache.get(token)
+    if email is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+            token_data = TokenData(email=email)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
-        raise credentials_exception
-    user = get_user(email=token_data.email)
+        email = token_data.email
+        # Never keep a token cached past its own expiry
+        expires_at = payload.get("exp")
+        token_cache.set(token, email, ttl=expires_at - time.time() if expires_at else None)
+    user = await get_cached_user(email)
     if user is None:
         raise credentials_exception
 
@@ -135,7 +168,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 
 @app.post("/api/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -150,22 +183,18 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 @app.post("/api/signup")
 async def signup(user: UserSignup):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
-        hashed_password = get_password_hash(user.password)
-        cur.execute("""
-            INSERT INTO users (first_name, last_name, date_of_birth, gender, country, email, password)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (user.first_name, user.last_name, user.date_of_birth, user.gender, user.country, user.email, hashed_password))
-        conn.commit()
-        return {"message": "User signed up successfully."}
-    except psycopg2.IntegrityError:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail="Email already registered")
-    finally:
-        cur.close()
-        conn.close()
+    hashed_password = await hashing.hash_password(user.password)
+    async with get_async_connection() as conn:
+        try:
+            # date_of_birth arrives as text; let Postgres parse it as before
+            await conn.execute("""
+                INSERT INTO users (first_name, last_name, date_of_birth, gender, country, email, password)
+                VALUES ($1, $2, $3::text::date, $4, $5, $6, $7)
+            """, user.first_name, user.last_name, user.date_of_birth, user.gender, user.country, user.email, hashed_password)
+        except asyncpg.IntegrityConstraintViolationError:
+            raise HTTPException(status_code=400, detail="Email already registered")
+    invalidate_user(user.email)
+    return {"message": "User signed up successfully."}
 
 @app.get("/api/user")
 async def get_user_data(current_user: dict = Depends(get_current_user)):
@@ -190,31 +219,26 @@ async def refresh_token(current_user: dict = Depends(get_current_user)):
 async def google_login(google_token: GoogleToken):
     try:
         # print(f"Received token: {google_token.token[:10]}...") # Print first 10 chars of token
-        idinfo = id_token.verify_oauth2_token(google_token.token, requests.Request(), GOOGLE_CLIENT_ID)
+        idinfo = await google_verifier.verify(google_token.token)
         
         # print(f"Decoded token info: {idinfo}")
         
         email = idinfo['email']
-        user = get_user(email)
+        user = await get_user(email)
         
         if not user:
             # Create a new user if they don't exist
-            conn = get_db_connection()
-            cur = conn.cursor()
-            try:
-                cur.execute("""
-                    INSERT INTO users (first_name, last_name, email)
-                    VALUES (%s, %s, %s)
-                """, (idinfo.get('given_name', ''), idinfo.get('family_name', ''), email))
-                conn.commit()
-                print(f"Created new user: {email}")
-            except psycopg2.IntegrityError as e:
-                conn.rollback()
-                print(f"Error creating user: {str(e)}")
-                raise HTTPException(status_code=400, detail=f"Email already registered: {str(e)}")
-            finally:
-                cur.close()
-                conn.close()
+            async with get_async_connection() as conn:
+                try:
+                    await conn.execute("""
+                        INSERT INTO users (first_name, last_name, email)
+                        VALUES ($1, $2, $3)
+                    """, idinfo.get('given_name', ''), idinfo.get('family_name', ''), email)
+                    invalidate_user(email)
+                    print(f"Created new user: {email}")
+                except asyncpg.IntegrityConstraintViolationError as e:
+                    print(f"Error creating user: {str(e)}")
+                    raise HTTPException(status_code=400, detail=f"Email already registered: {str(e)}")
         
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         access_token = create_access_token(
@@ -225,6 +249,57 @@ async def google_login(google_token: GoogleToken):
         print(f"Error verifying token: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Invalid token: {str(e)}")
 
+@app.get("/api/db/pool")
+async def db_pool_stats():
+    return async_pool.stats()
+
+@app.get("/api/auth/cache")
+async def auth_cache_stats():
+    return {"tokens": token_cache.stats(), "users": user_cache.stats()}
+
+# Request latency, per-phase timing and pool/cache/hashing gauges on GET /metrics
+metrics.install(app, "auth", collectors={
+    "auth_db_pool": async_pool.stats,
+    "auth_token_cache": token_cache.stats,
+    "auth_user_cache": user_cache.stats,
+    "auth_hashing_pool": hashing_pool.stats,
+    "auth_slow_queries": slow_query_log.stats,
+})
+# Per-request profiles on demand (X-Profile header or PROFILE_SAMPLE_RATE)
+profiling.install(app, "auth")
+
+@app.exception_handler(HashQueueFull)
+async def hash_queue_full_handler(request, exc):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, please try again shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("startup")
+async def start_google_verifier():
+    google_verifier.start()
+
+@app.on_event("shutdown")
+async def stop_google_verifier():
+    await google_verifier.stop()
+
+@app.on_event("startup")
+async def open_db_pool():
+    try:
+        await async_pool.open()
+    except (OSError, asyncpg.PostgresError) as e:
+        # The pool is opened lazily on first use if the database is not up yet
+        print(f"Error opening database pool: {str(e)}")
+
+@app.on_event("shutdown")
+async def close_db_pool():
+    await async_pool.close()
+
+@app.on_event("shutdown")
+def shutdown_hashing_pool():
+    hashing_pool.shutdown()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
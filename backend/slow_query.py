@@ -0,0 +1,238 @@
+import hashlib
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+# EXPLAIN (ANALYZE, BUFFERS) is captured for the N fingerprints with the most slow time,
+# at most once per fingerprint per SLOW_QUERY_EXPLAIN_INTERVAL seconds
+SLOW_QUERY_EXPLAIN_TOP = int(os.getenv("SLOW_QUERY_EXPLAIN_TOP", 5))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", 3600))
+SLOW_QUERY_REPORT = os.getenv("SLOW_QUERY_REPORT", "slow_query_report.txt")
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_RE = re.compile(r"\$\d+|%s|%\(\w+\)s")
+_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+_DOLLAR_PARAM_RE = re.compile(r"\$(\d+)")
+# Password hashes as stored by passlib, bcrypt and friends
+_HASH_RE = re.compile(r"^\$(argon2|2[aby]|pbkdf2|scrypt|bcrypt)")
+# Only read-only statements are re-run under EXPLAIN ANALYZE
+_EXPLAINABLE_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+# ...excluding row-locking reads and advisory locks, which would queue for the same
+# lock again, and statements with side effects that survive the rollback
+# (data-modifying CTEs, sequences) or that are slow on purpose (pg_sleep)
+_NOT_EXPLAINABLE_RE = re.compile(
+    r"\bfor\s+(update|no\s+key\s+update|share|key\s+share)\b|\b(insert|update|delete|merge)\b"
+    r"|\b(pg_advisory\w*|pg_try_advisory\w*|nextval|setval|pg_sleep\w*)\s*\(",
+    re.IGNORECASE,
+)
+
+
+def normalize(sql: str) -> str:
+    """Query text with literals and parameters replaced by ?, so equal shapes compare equal."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _PLACEHOLDER_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.lower().encode()).hexdigest()[:16]
+
+
+def redact(normalized: str, params):
+    """Parameters safe to log: hashes always, and every string of a statement touching passwords, are masked."""
+    if params is None:
+        return None
+    touches_password = "password" in normalized.lower()
+
+    def mask(value):
+        if isinstance(value, str) and (touches_password or _HASH_RE.match(value)):
+            return "***"
+        if isinstance(value, bytes) and touches_password:
+            return "***"
+        return value
+
+    if isinstance(params, dict):
+        return {key: mask(value) for key, value in params.items()}
+    return [mask(value) for value in params]
+
+
+def is_explainable(sql: str) -> bool:
+    """Whether re-running `sql` under EXPLAIN ANALYZE is side-effect free and does not take row locks."""
+    if not _EXPLAINABLE_RE.match(sql):
+        return False
+    # Keywords inside string literals do not count
+    return not _NOT_EXPLAINABLE_RE.search(_STRING_RE.sub("''", sql))
+
+
+def to_pyformat(sql: str, params):
+    """Rewrite an asyncpg ($1) statement for psycopg2 (%s), reordering params to match."""
+    order = [int(n) - 1 for n in _DOLLAR_PARAM_RE.findall(sql)]
+    return _DOLLAR_PARAM_RE.sub("%s", sql.replace("%", "%%")), [params[i] for i in order]
+
+
+class SlowQueryLog:
+    """Per-fingerprint slow statement stats, with EXPLAIN sampling on a background thread."""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, explain_top=SLOW_QUERY_EXPLAIN_TOP,
+                 explain_interval=SLOW_QUERY_EXPLAIN_INTERVAL, report_path=SLOW_QUERY_REPORT):
+        self.threshold = threshold_ms / 1000
+        self.explain_top = explain_top
+        self.explain_interval = explain_interval
+        self.report_path = report_path
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._explained_at = {}
+        self._explains = 0
+        self._queue = queue.Queue(maxsize=16)
+        self._worker = None
+
+    def record(self, sql, params, elapsed, dialect="pyformat"):
+        """Account one executed statement; `dialect` is "pyformat" (psycopg2) or "dollar" (asyncpg)."""
+        if elapsed < self.threshold:
+            return
+        normalized = normalize(sql)
+        fp = fingerprint(normalized)
+        with self._lock:
+            stats = self._stats.setdefault(fp, {"query": normalized, "count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+            explain = self._should_explain(fp, sql)
+        logger.warning(
+            f"Slow query {fp} ({elapsed * 1000:.1f} ms): {normalized} params={redact(normalized, params)}"
+        )
+        if explain:
+            try:
+                self._queue.put_nowait((fp, sql, params, dialect, elapsed))
+                self._ensure_worker()
+            except queue.Full:
+                pass
+
+    def _should_explain(self, fp, sql):
+        # Caller holds self._lock
+        if self.explain_top <= 0 or not is_explainable(sql):
+            return False
+        if time.monotonic() - self._explained_at.get(fp, float("-inf")) < self.explain_interval:
+            return False
+        slowest = sorted(self._stats, key=lambda key: self._stats[key]["total"], reverse=True)[:self.explain_top]
+        if fp not in slowest:
+            return False
+        self._explained_at[fp] = time.monotonic()
+        return True
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+                self._worker.start()
+
+    def _explain_loop(self):
+        # A dedicated connection, so EXPLAIN never runs inside an application transaction
+        from db import db_params
+
+        conn = None
+        while True:
+            fp, sql, params, dialect, elapsed = self._queue.get()
+            try:
+                if conn is None or conn.closed:
+                    conn = psycopg2.connect(**db_params)
+                if dialect == "dollar":
+                    sql, params = to_pyformat(sql, list(params or []))
+                cur = conn.cursor()
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+                    plan = "\n".join(row[0] for row in cur.fetchall())
+                finally:
+                    cur.close()
+                    # ANALYZE executed the statement; never keep its effects
+                    conn.rollback()
+                self._write_report(fp, elapsed, plan)
+            except Exception as e:
+                logger.error(f"Error explaining slow query {fp}: {str(e)}")
+                if conn is not None and conn.get_transaction_status() == extensions.TRANSACTION_STATUS_INERROR:
+                    conn.rollback()
+
+    def _write_report(self, fp, elapsed, plan):
+        with self._lock:
+            stats = dict(self._stats[fp])
+            self._explains += 1
+        with open(self.report_path, "a") as f:
+            f.write(
+                f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} fingerprint {fp}\n"
+                f"calls over threshold: {stats['count']}, total {stats['total'] * 1000:.1f} ms, "
+                f"max {stats['max'] * 1000:.1f} ms, this call {elapsed * 1000:.1f} ms\n"
+                f"{stats['query']}\n\n{plan}\n\n"
+            )
+
+    def slowest(self, n=10):
+        """The n fingerprints with the most time above the threshold."""
+        with self._lock:
+            ranked = sorted(self._stats.items(), key=lambda item: item[1]["total"], reverse=True)[:n]
+            return [{"fingerprint": fp, **stats} for fp, stats in ranked]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold_ms": self.threshold * 1000,
+                "fingerprints": len(self._stats),
+                "slow_queries": sum(stats["count"] for stats in self._stats.values()),
+                "explains": self._explains,
+            }
+
+
+slow_query_log = SlowQueryLog()
+
+
+class TimedCursor(extensions.cursor):
+    """psycopg2 cursor that reports statements slower than SLOW_QUERY_MS to slow_query_log.
+
+    Use as `psycopg2.connect(..., cursor_factory=TimedCursor)`.
+    """
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            slow_query_log.record(_text(query), vars, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            # Timed as one statement; no parameters are logged for the batch
+            slow_query_log.record(_text(query), None, time.perf_counter() - start)
+
+
+def _text(query):
+    if isinstance(query, bytes):
+        return query.decode()
+    if not isinstance(query, str):
+        # psycopg2.sql.Composable needs a connection to render; log its repr instead
+        return repr(query)
+    return query
+
+
+def log_asyncpg_query(record):
+    """asyncpg query logger (Connection.add_query_logger) feeding slow_query_log."""
+    slow_query_log.record(record.query, record.args, record.elapsed, dialect="dollar")
+
+
+async def init_asyncpg_connection(conn):
+    """asyncpg pool `init` hook: time every statement run on the connection."""
+    conn.add_query_logger(log_asyncpg_query)
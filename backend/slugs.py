@@ -0,0 +1,54 @@
+import re
+import unicodedata
+
+SLUG_MAX_LENGTH = 200
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def slugify(title: str) -> str:
+    """Lower-case, hyphen-separated URL slug; non-Latin letters are kept as-is."""
+    slug = unicodedata.normalize("NFKC", title).lower()
+    slug = _NON_WORD_RE.sub("-", slug.replace("_", "-")).strip("-")
+    return slug[:SLUG_MAX_LENGTH].rstrip("-") or "post"
+
+
+def _suffix_pattern(base: str) -> str:
+    # LIKE pattern matching "<base>-<anything>"
+    return base.replace("%", r"\%").replace("_", r"\_") + "-%"
+
+
+def _first_free(base: str, taken) -> str:
+    if base not in taken:
+        return base
+    suffix = 2
+    while f"{base}-{suffix}" in taken:
+        suffix += 1
+    return f"{base}-{suffix}"
+
+
+def unique_slug(cur, title: str) -> str:
+    """Slug for `title` that is not yet taken in blog_posts, adding -2, -3, ... if needed.
+
+    Call it in the transaction that inserts the slug: concurrent callers for the
+    same base slug wait on a transaction-scoped advisory lock, so the second one
+    sees the first one's row instead of picking the same slug.
+    """
+    base = slugify(title)
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (base,))
+    cur.execute(
+        "SELECT slug FROM blog_posts WHERE slug = %s OR slug LIKE %s",
+        (base, _suffix_pattern(base)),
+    )
+    return _first_free(base, {row[0] for row in cur.fetchall()})
+
+
+async def unique_slug_async(conn, title: str) -> str:
+    """unique_slug() for an asyncpg connection."""
+    base = slugify(title)
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", base)
+    rows = await conn.fetch(
+        "SELECT slug FROM blog_posts WHERE slug = $1 OR slug LIKE $2",
+        base, _suffix_pattern(base),
+    )
+    return _first_free(base, {row['slug'] for row in rows})
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Media is stored under a throwaway directory; UPLOAD_DIR is read at import time
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="test_uploads_"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from media_ingest import RequestSizeLimit, _PartSizes
+
+BOUNDARY = b"xyz"
+
+
+def multipart(*parts):
+    body = b""
+    for name, data in parts:
+        body += (b"--" + BOUNDARY + b"\r\nContent-Disposition: form-data; name=\"files\"; filename=\"" + name
+                 + b"\"\r\n\r\n" + data + b"\r\n")
+    return body + b"--" + BOUNDARY + b"--\r\n"
+
+
+def chunked(body, size=1000):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def make_client(limit, part_limit):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(files: list[UploadFile] = File(...)):
+        return {"sizes": [len(await f.read()) for f in files]}
+
+    return TestClient(RequestSizeLimit(app, limit=limit, part_limit=part_limit))
+
+
+def test_part_sizes_follow_delimiters_split_across_chunks():
+    parts = _PartSizes(BOUNDARY)
+    body = multipart((b"a.jpg", b"x" * 5000), (b"b.jpg", b"y" * 100))
+    sizes = [parts.feed(chunk) for chunk in chunked(body, 7)]
+    assert max(sizes) < 5000 + 100
+    assert sizes[-1] < 100
+
+
+def test_part_sizes_see_every_part_of_a_single_chunk():
+    body = multipart((b"a.jpg", b"x" * 5000), (b"b.jpg", b"y" * 100))
+    assert _PartSizes(BOUNDARY).feed(body) >= 5000
+
+
+def test_oversized_file_is_rejected_while_streaming():
+    client = make_client(limit=10 ** 6, part_limit=2000)
+    headers = {"content-type": "multipart/form-data; boundary=xyz"}
+    body = multipart((b"small.jpg", b"x" * 500), (b"big.jpg", b"y" * 50000))
+    response = client.post("/upload", content=chunked(body), headers=headers)
+    assert response.status_code == 413
+    assert "file" in response.json()["detail"]
+
+
+def test_oversized_request_is_rejected_from_content_length():
+    client = make_client(limit=1000, part_limit=10 ** 6)
+    body = multipart((b"a.jpg", b"x" * 5000))
+    response = client.post("/upload", content=body, headers={"content-type": "multipart/form-data; boundary=xyz"})
+    assert response.status_code == 413
+    assert "Request" in response.json()["detail"]
+
+
+def test_files_within_limits_pass_through():
+    client = make_client(limit=10 ** 6, part_limit=2000)
+    body = multipart((b"a.jpg", b"x" * 1500), (b"b.jpg", b"y" * 1500), (b"c.jpg", b"z" * 1500))
+    response = client.post("/upload", content=chunked(body), headers={"content-type": "multipart/form-data; boundary=xyz"})
+    assert response.status_code == 200
+    assert response.json() == {"sizes": [1500, 1500, 1500]}
@@ -0,0 +1,35 @@
+import io
+import os
+import stat
+import tempfile
+
+import media_store
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(os.path.join(media_store.UPLOAD_DIR, path)).st_mode)
+
+
+def test_stored_blob_is_readable_like_a_plain_file():
+    blob = media_store.store_fileobj(io.BytesIO(os.urandom(64)), "photo.jpg")
+    assert blob.created
+    assert mode(blob.path) == media_store.BLOB_MODE
+
+
+def test_linked_spool_file_gets_blob_mode():
+    os.makedirs(media_store.TMP_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=media_store.TMP_DIR) as spool:
+        spool.write(os.urandom(64))
+        spool.flush()
+        blob, method = media_store.store_spooled(spool.fileno(), "clip.mp4", spool.name)
+    assert method == "link"
+    assert mode(blob.path) == media_store.BLOB_MODE
+
+
+def test_copied_spool_file_gets_blob_mode():
+    with tempfile.TemporaryFile() as spool:
+        spool.write(os.urandom(64))
+        spool.flush()
+        blob, method = media_store.store_spooled(spool.fileno(), "clip.mp4")
+    assert method in ("copy_file_range", "chunked")
+    assert mode(blob.path) == media_store.BLOB_MODE
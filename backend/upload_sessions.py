@@ -0,0 +1,205 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+import weakref
+
+from media_store import UPLOAD_DIR, StoredBlob, store_spooled
+from metrics import phase
+
+logger = logging.getLogger(__name__)
+
+# One directory per session: meta.json plus the data received so far
+SESSIONS_DIR = os.path.join(UPLOAD_DIR, ".uploads")
+DEFAULT_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024))
+# Unfinished sessions are removed after this many seconds without a chunk
+SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600))
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    """Client-side problem with an upload session; carries the HTTP status to answer with."""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadSessions:
+    """Resumable uploads: create a session, send numbered chunks in order, then finalize.
+
+    The received offset is the size of the data file, so a session survives
+    restarts and a chunk cut off half-way is simply sent again.
+    """
+
+    def __init__(self, root=SESSIONS_DIR, max_file_bytes=None):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        # Only sessions with a request in flight hold a lock, so ids that 404 leave nothing behind
+        self._locks = weakref.WeakValueDictionary()
+
+    def _dir(self, upload_id):
+        if not _ID_RE.match(upload_id or ""):
+            raise UploadError(404, "Upload not found")
+        return os.path.join(self.root, upload_id)
+
+    def _read_meta(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError(404, "Upload not found")
+
+    def _write_meta(self, upload_id, meta):
+        path = os.path.join(self._dir(upload_id), "meta.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    def _lock(self, upload_id):
+        lock = self._locks.get(upload_id)
+        if lock is None:
+            lock = self._locks[upload_id] = asyncio.Lock()
+        return lock
+
+    def _offset(self, upload_id):
+        return os.path.getsize(os.path.join(self._dir(upload_id), "data"))
+
+    def _status(self, upload_id, meta):
+        offset = meta["size"] if "blob" in meta else self._offset(upload_id)
+        return {
+            "upload_id": upload_id,
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "chunk_size": meta["chunk_size"],
+            "offset": offset,
+            "next_chunk": offset // meta["chunk_size"],
+            "complete": offset == meta["size"],
+            "finalized": "blob" in meta,
+        }
+
+    def _create(self, filename, size, chunk_size):
+        if size < 0 or (self.max_file_bytes is not None and size > self.max_file_bytes):
+            raise UploadError(413, f"Uploads are limited to {self.max_file_bytes} bytes")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadError(400, f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id))
+        open(os.path.join(self._dir(upload_id), "data"), "wb").close()
+        meta = {"filename": filename, "size": size, "chunk_size": chunk_size, "created": time.time()}
+        self._write_meta(upload_id, meta)
+        return self._status(upload_id, meta)
+
+    async def create(self, filename, size, chunk_size=DEFAULT_CHUNK_SIZE):
+        return await asyncio.to_thread(self._create, filename, size, chunk_size)
+
+    async def status(self, upload_id):
+        return await asyncio.to_thread(lambda: self._status(upload_id, self._read_meta(upload_id)))
+
+    async def write_chunk(self, upload_id, index, body):
+        """Write chunk `index` from the async byte iterator `body`; returns the new status.
+
+        Chunks already received are acknowledged without rewriting them; a
+        chunk beyond the next expected one is rejected with 409.
+        """
+        with phase("file"):
+            return await self._write_chunk(upload_id, index, body)
+
+    async def _write_chunk(self, upload_id, index, body):
+        async with self._lock(upload_id):
+            meta = await asyncio.to_thread(self._read_meta, upload_id)
+            if "blob" in meta:
+                raise UploadError(409, "Upload is already finalized")
+            chunk_size, size = meta["chunk_size"], meta["size"]
+            start = index * chunk_size
+            expected = min(chunk_size, size - start)
+            if index < 0 or expected <= 0:
+                raise UploadError(400, f"Chunk {index} is out of range")
+            status = await asyncio.to_thread(self._status, upload_id, meta)
+            if index < status["next_chunk"]:
+                return status
+            if index > status["next_chunk"]:
+                raise UploadError(409, f"Expected chunk {status['next_chunk']}")
+
+            path = os.path.join(self._dir(upload_id), "data")
+            f = await asyncio.to_thread(open, path, "r+b")
+            try:
+                # Drop whatever is left of an interrupted attempt at this chunk
+                await asyncio.to_thread(f.truncate, start)
+                f.seek(start)
+                written = 0
+                async for piece in body:
+                    written += len(piece)
+                    if written > expected:
+                        raise UploadError(413, f"Chunk {index} must be {expected} bytes")
+                    await asyncio.to_thread(f.write, piece)
+                if written != expected:
+                    raise UploadError(400, f"Chunk {index} must be {expected} bytes, got {written}")
+            except BaseException:
+                await asyncio.to_thread(f.truncate, start)
+                raise
+            finally:
+                await asyncio.to_thread(f.close)
+            return await asyncio.to_thread(self._status, upload_id, meta)
+
+    def _finalize(self, upload_id):
+        meta = self._read_meta(upload_id)
+        if "blob" not in meta:
+            status = self._status(upload_id, meta)
+            if not status["complete"]:
+                raise UploadError(409, f"Upload is incomplete: {status['offset']} of {meta['size']} bytes")
+            data_path = os.path.join(self._dir(upload_id), "data")
+            with open(data_path, "rb") as f:
+                # The data file is already on the upload filesystem, so this is a link
+                blob, method = store_spooled(f.fileno(), meta["filename"], data_path)
+            os.unlink(data_path)
+            meta["blob"] = {"digest": blob.digest, "path": blob.path, "size": blob.size}
+            self._write_meta(upload_id, meta)
+            logger.info(f"Finalized upload {upload_id} -> {blob.path} ({blob.size} bytes, {method})")
+        return {**self._status(upload_id, meta), "url": StoredBlob(**meta["blob"], created=False).url}
+
+    async def finalize(self, upload_id):
+        """Move a complete upload into the blob store; calling it again returns the same result."""
+        async with self._lock(upload_id):
+            with phase("file"):
+                return await asyncio.to_thread(self._finalize, upload_id)
+
+    async def resolve(self, upload_id) -> StoredBlob:
+        """The stored blob of a finalized upload, for referencing it from a post."""
+        meta = await asyncio.to_thread(self._read_meta, upload_id)
+        if "blob" not in meta:
+            raise UploadError(409, f"Upload {upload_id} is not finalized")
+        return StoredBlob(**meta["blob"], created=False)
+
+    def _remove(self, upload_id):
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+        self._locks.pop(upload_id, None)
+
+    async def remove(self, upload_id):
+        """Discard a session; the blob of a finalized upload stays in the store."""
+        self._dir(upload_id)
+        await asyncio.to_thread(self._remove, upload_id)
+
+    def purge_expired(self, now=None):
+        """Remove sessions that have not received data within SESSION_TTL; returns how many."""
+        now = now or time.time()
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        for upload_id in os.listdir(self.root):
+            session_dir = os.path.join(self.root, upload_id)
+            try:
+                last_activity = max(os.path.getmtime(os.path.join(session_dir, name)) for name in os.listdir(session_dir))
+            except (OSError, ValueError):
+                last_activity = 0
+            if now - last_activity > SESSION_TTL:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                self._locks.pop(upload_id, None)
+                removed += 1
+        return removed